@@ -0,0 +1,209 @@
+"""Carpetas de Drive e índice de imágenes por (prompt, tipo), resueltos una vez por proceso."""
+
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from drive_listing import find_first_file, iter_folder_files
+from drive_manifest import DRIVE_IMAGE_FOLDERS, get_drive_manifest
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# Prefijo de nombre de archivo de cada tipo de imagen ("a_person_eating.jpg")
+IMAGE_PREFIXES = {
+    'neutral': "a_person_",
+    'older': "an_older_person_",
+}
+
+# Segundos que se reutiliza la configuración resuelta antes de volver a consultarla
+DRIVE_CONFIG_TTL = float(os.getenv('DRIVE_CONFIG_TTL', '3600'))
+# Segundos que se recuerda un fallo para no repetir la consulta en cada rerun
+DRIVE_CONFIG_RETRY_AFTER = float(os.getenv('DRIVE_CONFIG_RETRY_AFTER', '30'))
+
+ResolvedDriveConfig = namedtuple('ResolvedDriveConfig', [
+    'parent_folder_name',
+    'parent_folder_id',
+    'images_folder_id',
+    'csv_file_id',
+    'all_files',
+    'resolved_at',
+])
+
+
+def find_images_folder_and_csv_id(service, parent_folder_name):
+    """Busca la carpeta por nombre y devuelve (parent_folder_id, images_folder_id, csv_file_id, items)."""
+    parent_folder = find_first_file(
+        service,
+        f"name='{parent_folder_name}' and mimeType='{FOLDER_MIME_TYPE}' and trashed = false",
+        fields="id"
+    )
+    if not parent_folder:
+        raise LookupError(f"No se encontró la carpeta principal '{parent_folder_name}'.")
+    parent_folder_id = parent_folder['id']
+    items = list(iter_folder_files(service, parent_folder_id, fields="id, name, mimeType"))
+    images_folder_id = None
+    csv_file_id = None
+    for item in items:
+        if item['name'] == 'IMAGES' and item['mimeType'] == FOLDER_MIME_TYPE:
+            images_folder_id = item['id']
+        elif item['name'].endswith('.csv') and item['mimeType'] == 'text/csv':
+            csv_file_id = item['id']
+    if not images_folder_id:
+        raise LookupError("No se encontró la carpeta 'IMAGES'.")
+    return parent_folder_id, images_folder_id, csv_file_id, items
+
+
+def resolve_drive_config(service, parent_folder_name, shared_folder_id=None):
+    parent_folder_id, images_folder_id, csv_file_id, items = find_images_folder_and_csv_id(
+        service, parent_folder_name)
+
+    # La carpeta compartida por URL suele ser la misma: evitamos listarla dos veces
+    if shared_folder_id and shared_folder_id != parent_folder_id:
+        items = list(iter_folder_files(service, shared_folder_id, fields="id, name, mimeType"))
+
+    return ResolvedDriveConfig(
+        parent_folder_name=parent_folder_name,
+        parent_folder_id=parent_folder_id,
+        images_folder_id=images_folder_id,
+        csv_file_id=csv_file_id,
+        all_files=tuple(items),
+        resolved_at=datetime.now(),
+    )
+
+
+class DriveConfigCache:
+    """Memoiza la configuración resuelta por (carpeta, carpeta compartida) con TTL."""
+
+    def __init__(self, ttl=DRIVE_CONFIG_TTL, retry_after=DRIVE_CONFIG_RETRY_AFTER):
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._failures = {}
+
+    def _cached(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def get(self, service, parent_folder_name, shared_folder_id=None):
+        key = (parent_folder_name, shared_folder_id)
+        config = self._cached(key, time.monotonic())
+        if config is not None:
+            return config
+
+        with self._lock:
+            now = time.monotonic()
+            config = self._cached(key, now)
+            if config is not None:
+                return config
+            failure = self._failures.get(key)
+            if failure is not None and now - failure[0] < self.retry_after:
+                # Excepción nueva en cada rerun: relanzar la guardada acumularía su traceback
+                raise LookupError(
+                    f"No se pudo resolver la configuración de Drive hace {now - failure[0]:.0f}s "
+                    f"({failure[1]}); se reintentará en {self.retry_after - (now - failure[0]):.0f}s"
+                ) from None
+            try:
+                config = resolve_drive_config(service, parent_folder_name, shared_folder_id)
+            except Exception as e:
+                self._failures[key] = (now, f"{type(e).__name__}: {e}")
+                raise
+            self._failures.pop(key, None)
+            self._entries[key] = (now, config)
+            return config
+
+    def invalidate(self, parent_folder_name=None):
+        with self._lock:
+            if parent_folder_name is None:
+                self._entries.clear()
+                self._failures.clear()
+                return
+            for store in (self._entries, self._failures):
+                for key in [k for k in store if k[0] == parent_folder_name]:
+                    del store[key]
+
+
+_config_cache = DriveConfigCache()
+
+
+def get_drive_config(service, parent_folder_name, shared_folder_id=None):
+    return _config_cache.get(service, parent_folder_name, shared_folder_id)
+
+
+def invalidate_drive_config(parent_folder_name=None):
+    _config_cache.invalidate(parent_folder_name)
+
+
+def format_prompt(prompt):
+    return prompt.replace(" ", "_")
+
+
+def parse_image_name(name, image_type):
+    """Devuelve el prompt formateado de `name` o None si no sigue el patrón de `image_type`."""
+    prefix = IMAGE_PREFIXES[image_type]
+    stem, ext = os.path.splitext(name)
+    if not stem.startswith(prefix) or ext.lower() not in ('.jpg', '.jpeg'):
+        return None
+    return stem[len(prefix):]
+
+
+class DriveImageIndex:
+    """Índice (prompt, image_type) -> archivo de Drive, reconstruido solo cuando cambia el manifiesto."""
+
+    def __init__(self, manifest, folders=DRIVE_IMAGE_FOLDERS):
+        self.manifest = manifest
+        self.folders = folders
+        self._lock = threading.Lock()
+        self._index = {}
+        self._version = None
+
+    def _ensure_current(self):
+        if self._version == self.manifest.version:
+            return self._index
+        with self._lock:
+            if self._version != self.manifest.version:
+                version = self.manifest.version
+                index = {}
+                for image_type, folder_id in self.folders.items():
+                    for file in self.manifest.files_in_folder(folder_id):
+                        prompt = parse_image_name(file['name'], image_type)
+                        if prompt is not None:
+                            index[(prompt, image_type)] = file
+                self._index = index
+                self._version = version
+        return self._index
+
+    def get(self, prompt, image_type):
+        return self._ensure_current().get((format_prompt(prompt), image_type))
+
+    def get_pair(self, prompt):
+        """Devuelve {'neutral': file, 'older': file} con los tipos que existan."""
+        index = self._ensure_current()
+        prompt_formatted = format_prompt(prompt)
+        return {image_type: index[(prompt_formatted, image_type)]
+                for image_type in self.folders
+                if (prompt_formatted, image_type) in index}
+
+    def prompts(self):
+        """Prompts con imagen de todos los tipos."""
+        index = self._ensure_current()
+        return sorted(prompt.replace("_", " ") for prompt, image_type in index
+                      if image_type == 'neutral'
+                      and all((prompt, other) in index for other in self.folders))
+
+
+_image_index = None
+_image_index_lock = threading.Lock()
+
+
+def get_drive_image_index(service):
+    global _image_index
+    manifest = get_drive_manifest(service)
+    with _image_index_lock:
+        if _image_index is None or _image_index.manifest is not manifest:
+            _image_index = DriveImageIndex(manifest)
+    return _image_index
@@ -0,0 +1,137 @@
+"""Descargas de Drive por chunks y reanudables hacia una caché LRU en disco indexada por md5."""
+
+import os
+import re
+import time
+import random
+import logging
+import threading
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from google_quota import READ, acquire
+from local_cache import CACHE_DIR, DiskLRUCache
+
+logger = logging.getLogger(__name__)
+
+DRIVE_FILES_DIR = CACHE_DIR / "drive_files"
+
+# Presupuesto de disco de la caché de descargas
+DRIVE_CACHE_MAX_BYTES = int(float(os.getenv('DRIVE_CACHE_MAX_MB', '512')) * 1024 * 1024)
+# Tamaño de cada petición de rango al descargar
+DRIVE_DOWNLOAD_CHUNK_SIZE = int(float(os.getenv('DRIVE_DOWNLOAD_CHUNK_MB', '8')) * 1024 * 1024)
+# Reintentos de cada chunk (con backoff de la librería) y reanudaciones tras un error de red
+DRIVE_DOWNLOAD_RETRIES = int(os.getenv('DRIVE_DOWNLOAD_RETRIES', '3'))
+DRIVE_DOWNLOAD_RESUMES = int(os.getenv('DRIVE_DOWNLOAD_RESUMES', '5'))
+# Horas tras las que se borra un .part que nadie ha reanudado
+DRIVE_PARTIAL_MAX_AGE_HOURS = float(os.getenv('DRIVE_PARTIAL_MAX_AGE_HOURS', '24'))
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_drive_file_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRUCache(DRIVE_FILES_DIR, DRIVE_CACHE_MAX_BYTES, verify_md5=True,
+                                  partial_max_age_hours=DRIVE_PARTIAL_MAX_AGE_HOURS)
+    return _cache
+
+
+def _request_range(request, start, end, num_retries):
+    """GET de `bytes=start-end` sobre la URL de descarga, con backoff ante 429/5xx."""
+    headers = dict(request.headers, range=f"bytes={start}-{end}")
+    for attempt in range(num_retries + 1):
+        # Cada chunk es una petición a Drive y cuenta para la cuota
+        acquire('drive', READ)
+        resp, content = request.http.request(request.uri, request.method, headers=headers)
+        if resp.status not in RETRYABLE_STATUSES or attempt == num_retries:
+            break
+        time.sleep(2 ** attempt + random.random())
+    if resp.status >= 300:
+        raise HttpError(resp, content, uri=request.uri)
+    return resp, content
+
+
+def stream_drive_file(service, file_id, fh, offset=0, chunk_size=DRIVE_DOWNLOAD_CHUNK_SIZE,
+                      progress=None, num_retries=DRIVE_DOWNLOAD_RETRIES):
+    """
+    Escribe el archivo en `fh` por chunks de `chunk_size` empezando en `offset`.
+    `progress(bytes_done, total_bytes)` se llama tras cada chunk.
+    """
+    # Las peticiones de rango se hacen aquí y no con MediaIoBaseDownload, que no
+    # tiene una forma pública de empezar a mitad de archivo para reanudar un .part
+    request = service.files().get_media(fileId=file_id)
+    done_bytes = offset
+    total_size = None
+    while total_size is None or done_bytes < total_size:
+        resp, content = _request_range(request, done_bytes, done_bytes + chunk_size - 1, num_retries)
+        if resp.status == 200:
+            # Sin soporte de rangos llega el archivo entero: se reescribe desde el principio
+            fh.seek(0)
+            fh.truncate()
+            done_bytes = 0
+            total_size = len(content)
+        else:
+            match = re.search(r'/(\d+)$', resp.get('content-range', ''))
+            total_size = int(match.group(1)) if match else done_bytes + len(content)
+        fh.write(content)
+        done_bytes += len(content)
+        if progress is not None:
+            progress(done_bytes, total_size)
+        if not content:
+            break
+
+
+def _partial_size(partial_path):
+    try:
+        return partial_path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _download_to_partial(service, file_id, partial_path, chunk_size, progress):
+    resumes = 0
+    while True:
+        offset = _partial_size(partial_path)
+        try:
+            with open(partial_path, 'ab') as fh:
+                stream_drive_file(service, file_id, fh, offset, chunk_size, progress)
+            return partial_path
+        except (OSError, httplib2.HttpLib2Error) as e:
+            resumes += 1
+            if resumes > DRIVE_DOWNLOAD_RESUMES:
+                raise
+            logger.warning("Download of %s interrupted at %s bytes, resuming: %s",
+                           file_id, _partial_size(partial_path), e)
+        except HttpError as e:
+            # 416: el .part ya estaba completo
+            if e.resp.status == 416:
+                return partial_path
+            raise
+
+
+def download_drive_file(service, file_id, md5_checksum=None, cache=None,
+                        chunk_size=DRIVE_DOWNLOAD_CHUNK_SIZE, progress=None):
+    """Devuelve la ruta local del archivo, descargándolo de Drive solo si no está en caché."""
+    cache = cache or get_drive_file_cache()
+    if md5_checksum is None:
+        md5_checksum = service.files().get(fileId=file_id, fields="md5Checksum").execute()['md5Checksum']
+
+    path = cache.get(md5_checksum)
+    if path is not None:
+        return path
+
+    with cache.key_lock(md5_checksum):
+        # Otra sesión pudo terminar la descarga mientras esperábamos
+        path = cache.get(md5_checksum, count=False)
+        if path is not None:
+            return path
+        partial_path = _download_to_partial(
+            service, file_id, cache.partial_path_for(md5_checksum), chunk_size, progress)
+        return cache.put_file(md5_checksum, partial_path)
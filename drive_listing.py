@@ -0,0 +1,36 @@
+"""Listados de Drive paginados y perezosos: se sigue `nextPageToken` solo mientras hace falta."""
+
+import os
+
+MAX_PAGE_SIZE = 1000
+
+# Tamaño de página por defecto (Drive admite hasta 1000)
+DRIVE_PAGE_SIZE = int(os.getenv('DRIVE_PAGE_SIZE', str(MAX_PAGE_SIZE)))
+
+
+def iter_drive_files(service, q, fields="id, name", page_size=DRIVE_PAGE_SIZE, **params):
+    """Genera los archivos que cumplen `q`, pidiendo solo `fields` de cada uno."""
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    request = service.files().list(
+        q=q,
+        fields=f"nextPageToken, files({fields})",
+        pageSize=page_size,
+        **params
+    )
+    while request is not None:
+        response = request.execute()
+        yield from response.get('files', [])
+        request = service.files().list_next(request, response)
+
+
+def iter_folder_files(service, folder_id, fields="id, name", page_size=DRIVE_PAGE_SIZE, extra_query=None):
+    """Genera los archivos no eliminados que cuelgan directamente de `folder_id`."""
+    q = f"'{folder_id}' in parents and trashed = false"
+    if extra_query:
+        q = f"{q} and {extra_query}"
+    return iter_drive_files(service, q, fields=fields, page_size=page_size)
+
+
+def find_first_file(service, q, fields="id, name"):
+    """Devuelve el primer archivo que cumple `q` o None, con una sola petición de una página."""
+    return next(iter_drive_files(service, q, fields=fields, page_size=1), None)
@@ -0,0 +1,218 @@
+"""Manifiesto local de las carpetas de imágenes de Drive, actualizado con la API de cambios."""
+
+import os
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from googleapiclient.errors import HttpError
+
+from drive_listing import MAX_PAGE_SIZE, iter_folder_files
+from local_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = CACHE_DIR / "drive_manifest.json"
+
+# Segundos mínimos entre dos consultas a la API de cambios
+MANIFEST_REFRESH_INTERVAL = float(os.getenv('DRIVE_MANIFEST_REFRESH_INTERVAL', '60'))
+
+# Carpetas de Drive con las imágenes de cada tipo
+DRIVE_IMAGE_FOLDERS = {
+    'neutral': "1z8zZJQqMZDFtJG1hx7mosAt_5DlXuZU8",
+    'older': "1-zseBhQMP-KeK8EoLIt6M45zTApHOGzc",
+}
+
+FILE_FIELDS = "id, name, mimeType, md5Checksum, modifiedTime, parents"
+CHANGE_FIELDS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}, trashed))"
+
+# Respuestas de la API de cambios a un pageToken inválido o caducado
+INVALID_TOKEN_STATUSES = (400, 404)
+
+
+class DriveManifest:
+    """Manifiesto en disco de los archivos de las carpetas seguidas."""
+
+    def __init__(self, path=MANIFEST_PATH, refresh_interval=MANIFEST_REFRESH_INTERVAL):
+        self.path = Path(path)
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._folders = set()
+        self._files = {}
+        self._page_token = None
+        self._refreshed_at = None
+        self._last_check = 0.0
+        # Se incrementa con cada modificación para que los índices derivados se reconstruyan
+        self.version = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable Drive manifest %s: %s", self.path, e)
+            return
+        self._folders = set(data.get('folders', []))
+        self._files = data.get('files', {})
+        self._page_token = data.get('start_page_token')
+        self._refreshed_at = data.get('refreshed_at')
+
+    def _save(self):
+        data = {
+            'folders': sorted(self._folders),
+            'files': self._files,
+            'start_page_token': self._page_token,
+            'refreshed_at': self._refreshed_at,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def _store(self, file):
+        self._files[file['id']] = {
+            'id': file['id'],
+            'name': file['name'],
+            'mimeType': file.get('mimeType'),
+            'md5Checksum': file.get('md5Checksum'),
+            'modifiedTime': file.get('modifiedTime'),
+            'parents': [p for p in file.get('parents', []) if p in self._folders],
+        }
+
+    def track_folder(self, service, folder_id):
+        """Añade una carpeta al manifiesto listándola completa una única vez."""
+        with self._lock:
+            if folder_id in self._folders:
+                return
+            if self._page_token is None:
+                # El token se pide antes de listar para no perder cambios intermedios
+                self._page_token = service.changes().getStartPageToken().execute()['startPageToken']
+            self._folders.add(folder_id)
+            for file in iter_folder_files(service, folder_id, fields=FILE_FIELDS):
+                self._store(file)
+            self._last_check = time.monotonic()
+            self._refreshed_at = datetime.now().isoformat()
+            self.version += 1
+            self._save()
+
+    def relist(self, service):
+        """Descarta el token y vuelve a listar completas las carpetas seguidas."""
+        with self._lock:
+            # Como en track_folder: el token nuevo se pide antes de listar
+            self._page_token = service.changes().getStartPageToken().execute()['startPageToken']
+            files, self._files = self._files, {}
+            try:
+                for folder_id in self._folders:
+                    for file in iter_folder_files(service, folder_id, fields=FILE_FIELDS):
+                        self._store(file)
+            except Exception:
+                self._files = files
+                raise
+            self._last_check = time.monotonic()
+            self._refreshed_at = datetime.now().isoformat()
+            self.version += 1
+            self._save()
+            return len(self._files)
+
+    def refresh(self, service):
+        """Aplica los cambios de Drive desde el último token guardado."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            if self._page_token is None:
+                return 0
+            applied = 0
+            page_token = self._page_token
+            while page_token:
+                results = service.changes().list(
+                    pageToken=page_token,
+                    fields=CHANGE_FIELDS,
+                    pageSize=MAX_PAGE_SIZE
+                ).execute()
+                for change in results.get('changes', []):
+                    self._apply_change(change)
+                    applied += 1
+                if 'newStartPageToken' in results:
+                    self._page_token = results['newStartPageToken']
+                page_token = results.get('nextPageToken')
+            if applied:
+                self.version += 1
+            self._refreshed_at = datetime.now().isoformat()
+            self._save()
+            return applied
+
+    def refresh_if_stale(self, service):
+        if time.monotonic() - self._last_check < self.refresh_interval:
+            return 0
+        # Si otra sesión ya está refrescando, servimos el manifiesto actual sin esperar
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            if time.monotonic() - self._last_check < self.refresh_interval:
+                return 0
+            try:
+                return self.refresh(service)
+            except HttpError as e:
+                if e.resp.status not in INVALID_TOKEN_STATUSES:
+                    raise
+                # Token caducado o inválido: ya no hay forma de saber qué cambió
+                logger.warning("Drive changes page token rejected (%s), re-listing tracked folders",
+                               e.resp.status)
+                return self.relist(service)
+        except Exception as e:
+            # Un fallo de red no debe romper la página: seguimos con el manifiesto actual
+            logger.warning("Drive manifest refresh failed: %s", e)
+            return 0
+        finally:
+            self._lock.release()
+
+    def _apply_change(self, change):
+        file = change.get('file')
+        file_id = change['fileId']
+        if change.get('removed') or not file or file.get('trashed'):
+            self._files.pop(file_id, None)
+        elif self._folders.intersection(file.get('parents', [])):
+            self._store(file)
+        else:
+            # Se movió fuera de las carpetas seguidas
+            self._files.pop(file_id, None)
+
+    def get(self, file_id):
+        with self._lock:
+            return self._files.get(file_id)
+
+    def files_in_folder(self, folder_id):
+        with self._lock:
+            return [file for file in self._files.values() if folder_id in file['parents']]
+
+    def stats(self):
+        return {
+            'folders': len(self._folders),
+            'files': len(self._files),
+            'start_page_token': self._page_token,
+            'refreshed_at': self._refreshed_at,
+        }
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_drive_manifest(service, folder_ids=None):
+    """Devuelve el manifiesto del proceso, siguiendo `folder_ids` y con los cambios aplicados."""
+    global _manifest
+    if folder_ids is None:
+        folder_ids = DRIVE_IMAGE_FOLDERS.values()
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = DriveManifest()
+    for folder_id in folder_ids:
+        _manifest.track_folder(service, folder_id)
+    _manifest.refresh_if_stale(service)
+    return _manifest
@@ -20,155 +20,24 @@ from datetime import datetime
 
 from pathlib import Path
 
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload, HttpRequest
 from googleapiclient.errors import HttpError
 
-particles_js = """<!DOCTYPE html>
-<html lang="en">
-<head>
-  <meta charset="UTF-8">
-  <meta name="viewport" content="width=device-width, initial-scale=1.0">
-  <title>Particles.js</title>
-  <style>
-  #particles-js {
-    position: fixed;
-    width: 100vw;
-    height: 100vh;
-    top: 0;
-    left: 0;
-    z-index: -1; /* Send the animation to the back */
-  }
-  .content {
-    position: relative;
-    z-index: 1;
-    color: white;
-  }
-  
-</style>
-</head>
-<body>
-  <div id="particles-js"></div>
-  <div class="content">
-    <!-- Placeholder for Streamlit content -->
-  </div>
-  <script src="https://cdn.jsdelivr.net/particles.js/2.0.0/particles.min.js"></script>
-  <script>
-    particlesJS("particles-js", {
-      "particles": {
-        "number": {
-          "value": 300,
-          "density": {
-            "enable": true,
-            "value_area": 800
-          }
-        },
-        "color": {
-          "value": "#ffffff"
-        },
-        "shape": {
-          "type": "circle",
-          "stroke": {
-            "width": 0,
-            "color": "#000000"
-          },
-          "polygon": {
-            "nb_sides": 5
-          },
-          "image": {
-            "src": "img/github.svg",
-            "width": 100,
-            "height": 100
-          }
-        },
-        "opacity": {
-          "value": 0.5,
-          "random": false,
-          "anim": {
-            "enable": false,
-            "speed": 1,
-            "opacity_min": 0.2,
-            "sync": false
-          }
-        },
-        "size": {
-          "value": 2,
-          "random": true,
-          "anim": {
-            "enable": false,
-            "speed": 40,
-            "size_min": 0.1,
-            "sync": false
-          }
-        },
-        "line_linked": {
-          "enable": true,
-          "distance": 100,
-          "color": "#ffffff",
-          "opacity": 0.22,
-          "width": 1
-        },
-        "move": {
-          "enable": true,
-          "speed": 0.2,
-          "direction": "none",
-          "random": false,
-          "straight": false,
-          "out_mode": "out",
-          "bounce": true,
-          "attract": {
-            "enable": false,
-            "rotateX": 600,
-            "rotateY": 1200
-          }
-        }
-      },
-      "interactivity": {
-        "detect_on": "canvas",
-        "events": {
-          "onhover": {
-            "enable": true,
-            "mode": "grab"
-          },
-          "onclick": {
-            "enable": true,
-            "mode": "repulse"
-          },
-          "resize": true
-        },
-        "modes": {
-          "grab": {
-            "distance": 100,
-            "line_linked": {
-              "opacity": 1
-            }
-          },
-          "bubble": {
-            "distance": 400,
-            "size": 2,
-            "duration": 2,
-            "opacity": 0.5,
-            "speed": 1
-          },
-          "repulse": {
-            "distance": 200,
-            "duration": 0.4
-          },
-          "push": {
-            "particles_nb": 2
-          },
-          "remove": {
-            "particles_nb": 3
-          }
-        }
-      },
-      "retina_detect": true
-    });
-  </script>
-</body>
-</html>
-"""
+from google_clients import get_google_clients
+from drive_catalog import get_drive_config, get_drive_image_index
+from drive_manifest import get_drive_manifest
+from drive_downloads import download_drive_file
+from image_prefetch import SessionPrefetch
+from image_sources import ImagePair, get_image_source
+from static_assets import asset_bytes, asset_src, asset_url
+from particles_component import particles_background
+from theme import apply_page_styles
+from sheets_writer import submit_rows, resume_uploads
+from responses import TAG_OPTIONS, SessionResponses, response_rows
+
+# Segundos que se muestra la página de agradecimiento antes de volver a la portada
+END_PAGE_SECONDS = 20
+
 
 st.set_page_config(
     page_title="Falling Walls Summit '24",
@@ -178,39 +47,20 @@ st.set_page_config(
 
 #GSERVICES    
 def get_google_services():
+    # Los clientes se construyen una vez por proceso y se comparten entre sesiones
     try:
-        encoded_sa = os.getenv('GOOGLE_SERVICE_ACCOUNT')
-        if not encoded_sa:
-            raise ValueError("La variable de entorno GOOGLE_SERVICE_ACCOUNT no está configurada")
-
-        sa_json = base64.b64decode(encoded_sa).decode('utf-8')
-        sa_dict = json.loads(sa_json)
-
-        credentials = service_account.Credentials.from_service_account_info(
-            sa_dict,
-            scopes=[
-                'https://www.googleapis.com/auth/drive.readonly',
-                'https://www.googleapis.com/auth/spreadsheets'
-            ]
-        )
-
-        drive_service = build('drive', 'v3', credentials=credentials)
-        sheets_service = build('sheets', 'v4', credentials=credentials)
-
-        return drive_service, sheets_service
+        clients = get_google_clients()
+        return clients.drive, clients.sheets
     except Exception as e:
         st.error(f"Error al obtener los servicios de Google: {str(e)}")
         return None, None
 
 def download_file_from_google_drive(service, file_id):
+    # Caché en disco por md5: cada archivo se descarga una sola vez por máquina
     try:
-        request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        return fh.getvalue()
+        file = get_drive_manifest(service).get(file_id) or {}
+        path = download_drive_file(service, file_id, file.get('md5Checksum'))
+        return path.read_bytes()
     except Exception as e:
         st.error(f"Error al descargar el archivo: {str(e)}")
         return None
@@ -221,36 +71,6 @@ def extract_folder_id(url):
         return match.group(1)
     return None
 
-def find_images_folder_and_csv_id(service, parent_folder_name):
-    try:
-        results = service.files().list(
-            q=f"name='{parent_folder_name}' and mimeType='application/vnd.google-apps.folder'",
-            fields="nextPageToken, files(id)"
-        ).execute()
-        parent_folders = results.get('files', [])
-        if not parent_folders:
-            st.error(f"No se encontró la carpeta principal '{parent_folder_name}'.")
-            return None, None
-        parent_folder_id = parent_folders[0]['id']
-        results = service.files().list(
-            q=f"'{parent_folder_id}' in parents",
-            fields="nextPageToken, files(id, name, mimeType)"
-        ).execute()
-        items = results.get('files', [])
-        images_folder_id = None
-        csv_file_id = None
-        for item in items:
-            if item['name'] == 'IMAGES' and item['mimeType'] == 'application/vnd.google-apps.folder':
-                images_folder_id = item['id']
-            elif item['name'].endswith('.csv') and item['mimeType'] == 'text/csv':
-                csv_file_id = item['id']
-        if not images_folder_id:
-            st.error("No se encontró la carpeta 'IMAGES'.")
-        return images_folder_id, csv_file_id
-    except Exception as e:
-        st.error(f"Error al buscar la carpeta 'IMAGES' y el CSV: {str(e)}")
-        return None, None
-
 #TOOLS
 def generate_user_id():
     return str(uuid.uuid4())  # Unique user ID based on UUID
@@ -263,54 +83,27 @@ def display_pdf(pdf_bytes):
 def display_pdf_from_file(pdf_path):
     """Muestra un PDF desde un archivo local"""
     try:
-        with open(pdf_path, "rb") as f:
-            base64_pdf = base64.b64encode(f.read()).decode('utf-8')
-        pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="700" height="1000" type="application/pdf"></iframe>'
+        pdf_src = asset_src(pdf_path, st.context.headers.get("Host"))
+        pdf_display = f'<iframe src="{pdf_src}" width="700" height="1000" type="application/pdf"></iframe>'
         st.markdown(pdf_display, unsafe_allow_html=True)
     except Exception as e:
         st.error(f"Error al cargar el PDF: {str(e)}")
 
-@st.cache_data()
-def list_images_in_folder(_service, folder_id):
+def list_images_in_folder(service, folder_id):
+    # Servido desde el manifiesto local; solo la primera vez se lista la carpeta entera
     try:
-        results = _service.files().list(
-            q=f"'{folder_id}' in parents and mimeType contains 'image/'",
-            fields="nextPageToken, files(id, name)"
-        ).execute()
-        items = results.get('files', [])
-        return items
+        manifest = get_drive_manifest(service, [folder_id])
+        return [file for file in manifest.files_in_folder(folder_id)
+                if (file['mimeType'] or '').startswith('image/')]
     except Exception as e:
         st.error(f"Error al listar las imágenes: {str(e)}")
         return []
 
-@st.cache_data()
-def get_images_for_prompt_drive(_drive_service, prompt):
-    images = {}
-    
-    neutral_folder_id = "1z8zZJQqMZDFtJG1hx7mosAt_5DlXuZU8"
-    older_folder_id = "1-zseBhQMP-KeK8EoLIt6M45zTApHOGzc"
-
-    prompt_formatted = prompt.replace(" ", "_")  
-    neutral_filename = f"a_person_{prompt_formatted}.jpg"
-    older_filename = f"an_older_person_{prompt_formatted}.jpg"
-    
-    neutral_image_query = f"'{neutral_folder_id}' in parents"
-    neutral_results = _drive_service.files().list(q=neutral_image_query, fields="files(id, name)").execute()
-    neutral_files = neutral_results.get('files', [])
-    
-    neutral_file = next((file for file in neutral_files if file['name'] == neutral_filename), None)
-
-    older_image_query = f"'{older_folder_id}' in parents"
-    older_results = _drive_service.files().list(q=older_image_query, fields="files(id, name)").execute()
-    older_files = older_results.get('files', [])
-    
-
-    older_file = next((file for file in older_files if file['name'] == older_filename), None)
+def get_images_for_prompt_drive(drive_service, prompt):
+    prompt_formatted = prompt.replace(" ", "_")
 
-    if neutral_file:
-        images['neutral'] = neutral_file 
-    if older_file:
-        images['older'] = older_file  
+    # Búsqueda O(1) por (prompt, tipo) en el índice construido desde el manifiesto
+    images = get_drive_image_index(drive_service).get_pair(prompt)
 
     if 'neutral' not in images or 'older' not in images:
         st.error(f"Error: No se encontraron imágenes para el prompt '{prompt_formatted}'. Asegúrate de que existan en Google Drive.")
@@ -319,29 +112,17 @@ def get_images_for_prompt_drive(_drive_service, prompt):
     return images
 
 def get_images_for_prompt(prompt):
-    images = {}
-    
-    prompt_formatted = prompt.replace(" ", "_")  
+    # Par perezoso: no se abre ningún archivo hasta que una página pide los píxeles
+    prompt_formatted = prompt.replace(" ", "_")
+    images = ImagePair(get_image_source(), prompt)
 
-    neutral_filename = f"a_person_{prompt_formatted}.jpg"
-    older_filename = f"an_older_person_{prompt_formatted}.jpg"
-    
-    neutral_image_path = Path(__file__).parent / "IMAGES" / "neutral" / neutral_filename
-    older_image_path = Path(__file__).parent / "IMAGES" / "older" / older_filename
-
-    if os.path.exists(neutral_image_path):
-        images['neutral'] = Image.open(neutral_image_path)  # Cargar la imagen neutral
-    else:
-        st.warning(f"No se encontró la imagen neutral para el prompt '{prompt_formatted}'.")
+    missing = images.missing()
+    for image_type in missing:
+        st.warning(f"No se encontró la imagen {image_type} para el prompt '{prompt_formatted}'.")
 
-    if os.path.exists(older_image_path):
-        images['older'] = Image.open(older_image_path)  # Cargar la imagen older
-    else:
-        st.warning(f"No se encontró la imagen older para el prompt '{prompt_formatted}'.")
-
-    if 'neutral' not in images or 'older' not in images:
+    if missing:
         st.error(f"Error: No se encontraron ambas imágenes para el prompt '{prompt_formatted}'.")
-        return {}
+        return None
 
     return images
 
@@ -351,43 +132,25 @@ def save_responses_to_google_sheets(sheets_service, spreadsheet_id, user_id, use
         current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         values = []
         
-        for image_id, steps_data in image_responses.items():
-            image_path = Path(image_id)
-            image_type = "older" if "older" in str(image_path) else "neutral"
-            prompt = image_path.name.replace("a_person_", "").replace("an_older_person_", "").replace(".jpg", "")
-            
-            for step_key, step_data in steps_data.items():
-                tags_str = "|".join(step_data.get("Tags", []))
-                
-                words_str = "|".join(step_data.get("Words", []))
-                
-                # Crear fila con todos los datos
-                row = [
-                    user_id,                # ID único del usuario
-                    current_datetime,       # Timestamp
-                    user_age,              # Edad del usuario
-                    prompt,                # Prompt utilizado
-                    image_type,            # Tipo de imagen (older/neutral)
-                    step_key,              # Paso del cuestionario
-                    tags_str,              # Tags seleccionados
-                    words_str              # Palabras adicionales
-                ]
-                values.append(row)
-        
-        body = {
-            'values': values
-        }
-        
-        # Enviar datos a Google Sheets
-        result = sheets_service.spreadsheets().values().append(
-            spreadsheetId=spreadsheet_id,
-            range='Sheet1!A1', 
-            valueInputOption='USER_ENTERED',
-            insertDataOption='INSERT_ROWS',
-            body=body
-        ).execute()
+        rows = response_rows(image_responses, prompts, TAG_OPTIONS, "Step {}")
+        for prompt, image_type, step_key, tags_str, words_str in rows:
+            # Crear fila con todos los datos
+            row = [
+                user_id,                # ID único del usuario
+                current_datetime,       # Timestamp
+                user_age,              # Edad del usuario
+                prompt,                # Prompt utilizado
+                image_type,            # Tipo de imagen (older/neutral)
+                step_key,              # Paso del cuestionario
+                tags_str,              # Tags seleccionados
+                words_str              # Palabras adicionales
+            ]
+            values.append(row)
         
-        return True, "Responses saved successfully!"
+        # Se encola y lo sube el hilo de escritura; la llamada no espera a la API
+        submit_rows(sheets_service, spreadsheet_id, values)
+
+        return True, "Responses queued for upload!"
         
     except Exception as e:
         return False, f"Error saving to Google Sheets: {str(e)}"
@@ -432,6 +195,8 @@ def save_image_base64(image_path, output_file):
 class LocalImageHandler:
     def __init__(self):
         self.base_folder = Path(__file__).parent / "IMAGES"  # Definir la ruta base de la carpeta IMAGES
+        # Origen configurado (local o Drive); la ruta local sigue sirviendo de identificador
+        self.source = get_image_source()
         self.prompts = [
             "traveling",
             "eating",
@@ -462,7 +227,7 @@ class LocalImageHandler:
         formatted_prompt = prompt.replace(" ", "_")
         filename = f"{prefix}{formatted_prompt}.jpg"
         image_path = self.base_folder / image_type / filename
-        return image_path if image_path.is_file() else None
+        return image_path if self.source.exists(prompt, image_type) else None
 
     def get_images_for_prompt(self, prompt):
         """Obtiene las imágenes neutral y older para un prompt específico si existen."""
@@ -495,74 +260,62 @@ def initialize_session_state():
     if 'current_step' not in st.session_state:
         st.session_state.current_step = 1
     if 'image_responses' not in st.session_state:
-        st.session_state.image_responses = {}
+        st.session_state.image_responses = SessionResponses()
     if 'image_handler' not in st.session_state:
         st.session_state.image_handler = LocalImageHandler()
+    if 'session_prompts' not in st.session_state:
+        # Los tres prompts de la sesión se eligen al principio para poder precargar sus imágenes
+        st.session_state.session_prompts = random.sample(st.session_state.image_handler.prompts, 3)
     if 'current_prompt' not in st.session_state:
-        st.session_state.current_prompt = st.session_state.image_handler.get_random_prompt()
+        st.session_state.current_prompt = st.session_state.session_prompts[0]
     if 'user_id' not in st.session_state:
         st.session_state.user_id = str(uuid.uuid4())  # Generar ID único
     if 'user_age' not in st.session_state:
         st.session_state.user_age = None
 
 @st.fragment
-def tag_button_fragment(image_id, step_key, tags):
-    # Initialize a session state entry for the selected tags
-    if image_id not in st.session_state.image_responses:
-        st.session_state.image_responses[image_id] = {}
-    if step_key not in st.session_state.image_responses[image_id]:
-        st.session_state.image_responses[image_id][step_key] = {"Tags": [], "Comments": "", "Words": []}
-    
-    selected_tags = st.session_state.image_responses[image_id][step_key]["Tags"]
+def tag_button_fragment(prompt_index, image_type, step, tags):
+    response = st.session_state.image_responses.get(prompt_index, image_type, step)
     btn_cols = st.columns(2)
 
-    # Define button styles for selected/unselected states
-    st.markdown("""
-    <style>
-    div.stButton > button:focus, div.stButton > button:active {
-        background-color: #1a5d9c;
-        color: white !important;
-        border: none !important;
-        outline: none;
-        box-shadow: none !important;
-    }
-    div.stButton > button {
-        display: block;
-        margin: 0 auto;
-        font-size: 20px;
-        padding: 10px 40px;
-        background-color: #2986cc;
-        color: white;
-        border: none;
-        border-radius: 8px;
-        cursor: pointer;
-    }
-    div.stButton > button:hover {
-        background-color: #1a5d9c;
-        color: #F0FFFF !important;
-        border: none;
-    }
-    .stButton > button[kind=secondary] {
-        background-color: #28a745cc;
-        color: white;
-        border: 1px solid white;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-    # Create tag buttons in two columns
+    # Create tag buttons in two columns; el bit j de la respuesta es la etiqueta j
     for j, tag in enumerate(tags):
         with btn_cols[j % 2]:
-            button_key = f"tag_button_{step_key}_{image_id}_{j}"
-            is_selected = tag in selected_tags
+            button_key = f"tag_button_{step}_{prompt_index}_{image_type}_{j}"
+            is_selected = response.has_tag(j)
             if st.button(tag, key=button_key, use_container_width=True, type="secondary" if is_selected else "primary"):
-                if is_selected:
-                    selected_tags.remove(tag)
-                else:
-                    selected_tags.append(tag)
-                st.session_state.image_responses[image_id][step_key]["Tags"] = selected_tags
+                response.toggle_tag(j)
                 st.rerun(scope="fragment")
 
+@st.fragment
+def words_form_fragment(prompt_index, image_type, step, form_key):
+    # Enviar una palabra solo vuelve a ejecutar este fragmento, no todo main()
+    response = st.session_state.image_responses.get(prompt_index, image_type, step)
+    form = st.form(key=form_key)
+    comment = form.text_input(
+        label='Describe the image in other words (20 characters):',
+        placeholder="Write here"
+    )
+    submit_button = form.form_submit_button(label='Submit')
+
+    if submit_button and comment:
+        response.add_word(comment)
+
+    words_list = response.word_list()
+    st.multiselect(
+        "Submitted Words",  
+        options=words_list,
+        key=f"words_multiselect_{prompt_index}_{image_type}_{step}", 
+        default=words_list
+    )
+
+@st.fragment(run_every=END_PAGE_SECONDS)
+def return_to_landing(shown_at):
+    # La primera ejecución es la del script completo; la siguiente, a los END_PAGE_SECONDS,
+    # relanza la app (ya reiniciada en 'landing') sin dejar ningún hilo dormido
+    if time.time() - shown_at >= END_PAGE_SECONDS - 1:
+        st.rerun()
+
 prompts = [
     "traveling",
     "eating",
@@ -595,6 +348,9 @@ def main():
         st.error("No se pudieron obtener los servicios de Google.")
         return
 
+    # Sube las respuestas que un proceso anterior dejó en el outbox
+    resume_uploads(sheets_service)
+
     drive_url = "https://drive.google.com/drive/u/0/folders/1GwfHfrsEH7jGisVdeUdGJOPG7TlbUyl8"
     parent_folder_name = "10_14_FALLING_WALLS"
     spreadsheet_id = "1kkpKzDOkwJ58vgvp0IIAhS-yOSJxId8VJ4Bjxj7MmJk"
@@ -608,49 +364,37 @@ def main():
         st.session_state.current_step = 1
     if 'user_id' not in st.session_state:
         st.session_state.user_id = ''
-    if 'random_images' not in st.session_state:
-        st.session_state.random_images = []
     if 'image_responses' not in st.session_state:
-        st.session_state.image_responses = {}
-    if 'all_files' not in st.session_state:
-        st.session_state.all_files = []
+        st.session_state.image_responses = SessionResponses()
+
 
+    # Las seis imágenes de la sesión se cargan en segundo plano mientras se ve la portada
+    if 'image_prefetch' not in st.session_state:
+        st.session_state.image_prefetch = SessionPrefetch(
+            st.session_state.session_prompts,
+            st.session_state.image_handler.source)
 
+    # Carpetas y CSV se resuelven una vez por proceso (con TTL) y no en cada rerun
+    drive_config = None
     if parent_folder_id:
-        images_folder_id, csv_file_id = find_images_folder_and_csv_id(drive_service, parent_folder_name)
-        if images_folder_id: #and csv_file_id:
-            current_prompt = random.choice(prompts)  
-            images = get_images_for_prompt(current_prompt)  
-            if 'neutral' in images and 'older' in images:
-                st.session_state.random_images = [images['neutral'], images['older']]
-            else:
-                st.error("No se encontraron imágenes adecuadas para el prompt.")
-            
-            if not st.session_state.all_files: 
-                results = drive_service.files().list(
-                    q=f"'{parent_folder_id}' in parents",  # Query for files in the parent folder
-                    fields="nextPageToken, files(id, name, mimeType)"
-                ).execute()
-                st.session_state.all_files = results.get('files', [])                
-        else:
+        try:
+            drive_config = get_drive_config(drive_service, parent_folder_name, parent_folder_id)
+        except Exception as e:
+            st.error(f"Error al buscar la carpeta 'IMAGES' y el CSV: {str(e)}")
+        if not drive_config:
             st.error("No se pudieron encontrar las imágenes")  #o el archivo CSV.
     else:
         st.error("Could not obtain the parent folder ID.")
 
+    # Estilos de la página: solo se envían cuando cambian
+    apply_page_styles(st.session_state.page)
+
 #Landing
     if st.session_state.page == 'landing':
-        components.html(particles_js, height=0, scrolling=False)
+        particles_background(height=0, key="particles_landing")
 
         st.markdown(
             """
-            <!-- Estilos personalizados para el componente -->
-            <style>
-                /* Eliminar padding superior en el elemento raíz */
-                #root > div:nth-child(1) > div > div > div > div > section > div {
-                    padding-top: 0rem;
-                }
-            </style>
-
             <!-- Título centrado -->
             <h1 style='text-align: center;'>How is age depicted in AI?</h1>
             """, 
@@ -664,20 +408,24 @@ def main():
         """, unsafe_allow_html=True)
 
         video_path = Path(__file__).parent / "IMAGES" / "video.mp4"
-        video_file = open(video_path, "rb")
-        video_bytes = video_file.read()
-
-        st.markdown(
-            """
-            <div style="max-width: 800px; margin: 0 auto;">
-                <video width="100%" autoplay loop muted>
-                    <source src="data:video/mp4;base64,{base64_video}" type="video/mp4">
-                    Your browser does not support the video tag.
-                </video>
-            </div>
-            """.format(base64_video=base64.b64encode(video_bytes).decode('utf-8')),
-            unsafe_allow_html=True
-)
+        # Con servidor de assets, URL cacheable; si no, el endpoint de medios de Streamlit
+        # (mismo origen y con rangos) en lugar de reenviar el vídeo en base64
+        video_url = asset_url(video_path, st.context.headers.get("Host"))
+        if video_url:
+            st.markdown(
+                """
+                <div style="max-width: 800px; margin: 0 auto;">
+                    <video width="100%" autoplay loop muted>
+                        <source src="{video_src}" type="video/mp4">
+                        Your browser does not support the video tag.
+                    </video>
+                </div>
+                """.format(video_src=video_url),
+                unsafe_allow_html=True
+            )
+        else:
+            # Bytes leídos una vez por proceso (se recargan si cambia el mtime)
+            st.video(asset_bytes(video_path), format="video/mp4", autoplay=True, loop=True, muted=True)
 
         #st.video(video_bytes, start_time=0, end_time=None, loop=True, autoplay=True, muted=True)
 
@@ -696,36 +444,6 @@ def main():
         # </center>
         # """, unsafe_allow_html=True)
 
-        st.markdown("""
-        <style>
-        div.stButton > button:focus, /* Añadido :focus */
-        div.stButton > button:active {
-            background-color: #1a5d9c;
-            color: white !important; /* Añadido !important */
-            border: none !important;
-            outline: none; /* Evita el contorno azul por defecto */
-            box-shadow: none !important;
-        }
-
-        div.stButton > button {  /* Mayor especificidad para :hover */
-            display: block;
-            margin: 0 auto;
-            font-size: 20px;
-            padding: 10px 40px;
-            background-color: #2986cc;
-            color: white;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-
-        }
-        div.stButton > button:hover {
-            background-color: #1a5d9c;
-            color: #F0FFFF !important; /* color al pasar el cursor  */
-            border: none;
-        }
-        </style>
-        """, unsafe_allow_html=True)
         
         if st.button("Start", key="intro_button", use_container_width=False):
             st.session_state.page = 'prompt1'
@@ -743,36 +461,6 @@ def main():
             #st.markdown(f"<h2 style='text-align: center;'>STEP {st.session_state.current_step} of 3</h2>", unsafe_allow_html=True)
             st.markdown(f"<h2 style='text-align: center;'>How does AI depict individuals {current_prompt.replace('_', ' ')} based on their age?</h2>", unsafe_allow_html=True)
             
-            st.markdown("""
-            <style>
-            div.stButton > button:focus, /* Añadido :focus */
-            div.stButton > button:active {
-                background-color: #1a5d9c;
-                color: white !important; /* Añadido !important */
-                border: none !important;
-                outline: none; /* Evita el contorno azul por defecto */
-                box-shadow: none !important;
-            }
-
-            div.stButton > button {  /* Mayor especificidad para :hover */
-                display: block;
-                margin: 0 auto;
-                font-size: 20px;
-                padding: 10px 40px;
-                background-color: #2986cc;
-                color: white;
-                border: none;
-                border-radius: 8px;
-                cursor: pointer;
-
-            }
-            div.stButton > button:hover {
-                background-color: #1a5d9c;
-                color: #F0FFFF !important; /* color al pasar el cursor  */
-                border: none;
-            }
-            </style>
-            """, unsafe_allow_html=True)
 
             st.markdown("")
 
@@ -780,36 +468,10 @@ def main():
                 st.session_state.page = 'questionnaire'
                 st.rerun()
 
-        components.html(particles_js, height=350,width=1050, scrolling=False)
+        particles_background(height=350, key="particles_prompt")
 
 #QUESTIONNAIRE
     elif st.session_state.page == 'questionnaire':
-        st.markdown(
-        """
-        <style>
-        #root > div:nth-child(1) > div > div > div > div > section > div {
-            padding-top: 0rem;
-        }
-        /* Estilos más específicos para centrar las imágenes */
-        [data-testid="column"] > div:first-child {
-            display: flex;
-            justify-content: center;
-            align-items: center;
-        }
-        [data-testid="column"] > div:first-child > div {
-            width: 100%;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-        }
-        /* Asegurar que el caption también está centrado */
-        [data-testid="caption"] {
-            text-align: center !important;
-        }
-        </style>
-        """, 
-        unsafe_allow_html=True)
-
         col1, col2, col3 = st.columns([2, 2, 1.4])
 
         # Obtener imágenes para el prompt actual
@@ -819,8 +481,8 @@ def main():
         for i, (key, image_data) in enumerate(images.items()):
                     column = col1 if i == 0 else col2
                     with column:
-                        if image_data['path'].exists():
-                            image = Image.open(image_data['path'])
+                        image = st.session_state.image_prefetch.get(current_prompt, key)
+                        if image is not None:
                             # st.image(image, width=400,use_column_width=True,caption=f"Prompt: {image_data['name']}")
                             st.image(image,width=400,use_column_width=True)
                             caption_text = image_data['name'].replace("Older person", "<b>Older person</b>").replace("Person", "<b>Person</b>")
@@ -829,103 +491,16 @@ def main():
                         else:
                             st.error(f"Image not found: {image_data['path']}")
                         
-                        image_id = str(image_data['path'])
-                        step_key = f"Step {st.session_state.current_step}"
-
-                        if image_id not in st.session_state.image_responses:
-                            st.session_state.image_responses[image_id] = {}
-
-                        if step_key not in st.session_state.image_responses[image_id]:
-                            st.session_state.image_responses[image_id][step_key] = {"Tags": [], "Comments": "", "Words": []}
-
-                        tags = {
-                            1: ["Vulnerable", "Strong", "Hallucinated", "Realistic", "Passive", "Active",
-                                "Weak", "Capable", "Relaxed", "Worried"],
-                            2: ["Vulnerable", "Strong", "Hallucinated", "Realistic", "Passive", "Active",
-                                "Weak", "Capable", "Relaxed", "Worried"],
-                            3: ["Vulnerable", "Strong", "Hallucinated", "Realistic", "Passive", "Active",
-                                "Weak", "Capable", "Relaxed", "Worried"],
-                        }
-
-                        # Crear el multiselect encima de los botones
-                        selected_tags = st.session_state.image_responses[image_id][step_key]["Tags"]
-
-                        selected = selected_tags #AFEGIT PER LO D'ADALT
-
-                        st.session_state.image_responses[image_id][step_key]["Tags"] = selected
-
-                        btn_cols = st.columns(2)
-
-                        st.markdown("""
-                        <style>
-                        div.stButton > button:focus, /* Añadido :focus */
-                        div.stButton > button:active {
-                            background-color: #1a5d9c;
-                            color: white !important; /* Añadido !important */
-                            border: none !important;
-                            outline: none; /* Evita el contorno azul por defecto */
-                            box-shadow: none !important;
-                        }
-
-                        div.stButton > button {  /* Mayor especificidad para :hover */
-                            display: block;
-                            margin: 0 auto;
-                            font-size: 20px;
-                            padding: 10px 40px;
-                            background-color: #2986cc;
-                            color: white;
-                            border: none;
-                            border-radius: 8px;
-                            cursor: pointer;
-
-                        }
-                        div.stButton > button:hover {
-                            background-color: #1a5d9c;
-                            color: #F0FFFF !important; /* color al pasar el cursor  */
-                            border: none;
-                        }
-                        /* Estilo para botones seleccionados */
-                        .stButton > button[kind=secondary] {
-                            background-color: #28a745cc;
-                            color: white;
-                            border: 1px solid white;
-                        }
-                                    
-                        button[kind=secondary]
-                        </style>
-                        """, unsafe_allow_html=True)
-
-                        current_step = st.session_state.current_step
-                        tag_button_fragment(image_id, step_key, tags[current_step])
-
-                        # Formulario individual para cada imagen
-                        form = st.form(key=f'form_step{st.session_state.current_step}_img{i}')
-                        comment = form.text_input(
-                            label='Describe the image in other words (20 characters):',
-                            placeholder="Write here"
-                        )
-                        submit_button = form.form_submit_button(label='Submit')
-
-                        if submit_button:
-                            if comment:
-                                if "Words" not in st.session_state.image_responses[image_id][step_key]:
-                                    st.session_state.image_responses[image_id][step_key]["Words"] = []
-                    
-                                words_list = st.session_state.image_responses[image_id][step_key]["Words"]
-                                if comment not in words_list:
-                                    words_list.append(comment)
-                                    st.session_state.image_responses[image_id][step_key]["Words"] = words_list
-
-                        words_list = st.session_state.image_responses[image_id][step_key].get("Words", [])
-                        st.multiselect(
-                            "Submitted Words",  
-                            options=words_list,
-                            key=f"words_multiselect_{image_id}_{st.session_state.current_step}", 
-                            default=words_list
-                        )
+                        prompt_index = st.session_state.image_handler.prompts.index(current_prompt)
+                        step = st.session_state.current_step
+
+                        tag_button_fragment(prompt_index, key, step, TAG_OPTIONS)
+
+                        # Formulario individual para cada imagen, aislado como las etiquetas
+                        words_form_fragment(prompt_index, key, step, f'form_step{step}_img{i}')
 
         with col3:
-            components.html(particles_js, height=880,width=250, scrolling=False)
+            particles_background(height=880, key="particles_sidebar")
 
             st.markdown(f"<h4 style='text-align: center;'> Step {st.session_state.current_step} of 3</h4>", unsafe_allow_html=True)
             
@@ -934,11 +509,10 @@ def main():
             if st.button(button_label, key=f"next_button_step{st.session_state.current_step}_unique", use_container_width=True):
                 if st.session_state.current_step < 3:
                     st.session_state.current_step += 1
-                    st.session_state.current_prompt = random.choice(prompts)  #
+                    st.session_state.current_prompt = st.session_state.session_prompts[st.session_state.current_step - 1]
                 else:
                     st.session_state.page = 'age_input'  
-                    st.session_state.current_step = 1  
-                    st.session_state.current_prompt = random.choice(prompts)  
+                    st.session_state.current_step = 1
 
                 if st.session_state.page != 'age_input':  
                     st.session_state.page = 'prompt1'
@@ -952,36 +526,6 @@ def main():
         #user_age = st.text_input("", value="", placeholder="...")  # Campo de texto para la edad (opcional)
         user_age = st.number_input("", step=1)  # Campo de texto para la edad (opcional)
 
-        st.markdown("""
-        <style>
-        div.stButton > button:focus, /* Añadido :focus */
-        div.stButton > button:active {
-            background-color: #1a5d9c;
-            color: white !important; /* Añadido !important */
-            border: none !important;
-            outline: none; /* Evita el contorno azul por defecto */
-            box-shadow: none !important;
-        }
-
-        div.stButton > button {  /* Mayor especificidad para :hover */
-            display: block;
-            margin: 0 auto;
-            font-size: 20px;
-            padding: 10px 40px;
-            background-color: #2986cc;
-            color: white;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-
-        }
-        div.stButton > button:hover {
-            background-color: #1a5d9c;
-            color: #F0FFFF !important; /* color al pasar el cursor  */
-            border: none;
-        }
-        </style>
-        """, unsafe_allow_html=True)
 
         # Botón de continuar
         if st.button("Submit"):
@@ -1015,37 +559,23 @@ def main():
                 current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 values = []
 
-                for image_id, steps_data in st.session_state.image_responses.items():
-                    image_path = Path(image_id)
-                    image_type = "older" if "older" in str(image_path) else "neutral"
-                    prompt = image_path.name.replace("a_person_", "").replace("an_older_person_", "").replace(".jpg", "")
-
-                    for step_key, step_data in steps_data.items():
-                        tags_str = "|".join(step_data.get("Tags", []))
-                        words_str = "|".join(step_data.get("Words", []))
-
-                        row = [
-                            st.session_state.user_id,
-                            current_datetime,
-                            st.session_state.get('user_age', ''),
-                            prompt,
-                            image_type,
-                            step_key,
-                            tags_str,
-                            words_str
-                        ]
-                        values.append(row)
-
-                body = {'values': values}
-
-                # Enviar datos a Google Sheets
-                result = sheets_service.spreadsheets().values().append(
-                    spreadsheetId=spreadsheet_id,
-                    range='Sheet1!A1',
-                    valueInputOption='USER_ENTERED',
-                    insertDataOption='INSERT_ROWS',
-                    body=body
-                ).execute()
+                rows = response_rows(st.session_state.image_responses, st.session_state.image_handler.prompts,
+                                     TAG_OPTIONS, "Step {}")
+                for prompt, image_type, step_key, tags_str, words_str in rows:
+                    row = [
+                        st.session_state.user_id,
+                        current_datetime,
+                        st.session_state.get('user_age', ''),
+                        prompt,
+                        image_type,
+                        step_key,
+                        tags_str,
+                        words_str
+                    ]
+                    values.append(row)
+
+                # Se escribe en segundo plano: la página de fin no espera a la API de Sheets
+                submit_rows(sheets_service, spreadsheet_id, values)
 
                 st.session_state.data_saved = True
                 #st.success("✅ Data successfully saved to Google Sheets!")
@@ -1055,40 +585,10 @@ def main():
             st.write("Error details:", str(e))
             st.write("Please contact support with the error message above.")
         
-        st.markdown("""
-        <style>
-        div.stButton > button:focus, /* Añadido :focus */
-        div.stButton > button:active {
-            background-color: #1a5d9c;
-            color: white !important; /* Añadido !important */
-            border: none !important;
-            outline: none; /* Evita el contorno azul por defecto */
-            box-shadow: none !important;
-        }
-
-        div.stButton > button {  /* Mayor especificidad para :hover */
-            display: block;
-            margin: 0 auto;
-            font-size: 20px;
-            padding: 10px 40px;
-            background-color: #2986cc;
-            color: white;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-
-        }
-        div.stButton > button:hover {
-            background-color: #1a5d9c;
-            color: #F0FFFF !important; /* color al pasar el cursor  */
-            border: none;
-        }
-        </style>
-        """, unsafe_allow_html=True)
 
         # if st.button("Start new questionnaire"):
         #     st.session_state.current_step = 1
-        #     st.session_state.image_responses = {}
+        #     st.session_state.image_responses = SessionResponses()
         #     st.session_state.page = 'landing'
         #     st.session_state.user_id = str(uuid.uuid4())
         #     st.session_state.user_age = None
@@ -1098,16 +598,21 @@ def main():
 
         # Redirigir automáticamente a la página de inicio
         st.session_state.current_step = 1
-        st.session_state.image_responses = {}
+        st.session_state.image_responses = SessionResponses()
         st.session_state.page = 'landing'
         st.session_state.user_id = str(uuid.uuid4())
         st.session_state.user_age = None
         st.session_state.review_mode = False
         st.session_state.data_saved = False
-
-        time.sleep(20)
-
-        st.rerun()
+        st.session_state.session_prompts = random.sample(prompts, 3)
+        st.session_state.current_prompt = st.session_state.session_prompts[0]
+        # Los trabajos de la sesión que aún estén en cola no deben ocupar los hilos compartidos
+        prefetch = st.session_state.pop('image_prefetch', None)
+        if prefetch is not None:
+            prefetch.cancel()
+
+        # Vuelve a la portada a los END_PAGE_SECONDS sin bloquear el hilo del script
+        return_to_landing(time.time())
 
 if __name__ == "__main__":
     main()
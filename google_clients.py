@@ -0,0 +1,253 @@
+"""Credenciales y clientes de Drive y Sheets, construidos una vez por proceso y compartidos por todas las sesiones."""
+
+import os
+import json
+import queue
+import base64
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2 import service_account
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import HttpRequest
+
+from google_quota import acquire, api_name, method_class
+
+logger = logging.getLogger(__name__)
+
+SCOPES = [
+    'https://www.googleapis.com/auth/drive.readonly',
+    'https://www.googleapis.com/auth/spreadsheets'
+]
+
+# Documentos de descubrimiento fijados que se distribuyen con la app
+DISCOVERY_DIR = Path(__file__).parent / "discovery"
+PINNED_APIS = [('drive', 'v3'), ('sheets', 'v4')]
+
+# Segundos tras los que se reconstruyen los clientes (0 = nunca)
+CLIENTS_MAX_AGE = float(os.getenv('GOOGLE_CLIENTS_MAX_AGE', '0'))
+# Transportes autorizados (con su conexión abierta) compartidos por todos los hilos
+GOOGLE_HTTP_POOL_SIZE = int(os.getenv('GOOGLE_HTTP_POOL_SIZE', '8'))
+
+
+def load_discovery_document(api, version):
+    """Lee el documento de descubrimiento fijado para `api`/`version`."""
+    path = DISCOVERY_DIR / f"{api}.{version}.json"
+    with open(path, encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('name') != api or document.get('version') != version:
+        raise ValueError(
+            f"El documento {path.name} describe {document.get('name')} {document.get('version')}, "
+            f"no {api} {version}"
+        )
+    return document
+
+
+def check_discovery_documents():
+    """
+    Compara los documentos fijados con los que trae google-api-python-client.
+    Devuelve una lista de avisos; vacía si todo coincide.
+    """
+    warnings = []
+    for api, version in PINNED_APIS:
+        try:
+            pinned = load_discovery_document(api, version)
+        except Exception as e:
+            warnings.append(f"{api} {version}: {e}")
+            continue
+        bundled = get_static_doc(api, version)
+        if bundled is None:
+            continue
+        bundled_revision = json.loads(bundled).get('revision')
+        if bundled_revision != pinned.get('revision'):
+            warnings.append(
+                f"{api} {version}: revisión fijada {pinned.get('revision')}, "
+                f"la librería trae {bundled_revision}"
+            )
+    for warning in warnings:
+        logger.warning("Discovery document mismatch: %s", warning)
+    return warnings
+
+
+def load_service_account_credentials():
+    encoded_sa = os.getenv('GOOGLE_SERVICE_ACCOUNT')
+    if not encoded_sa:
+        raise ValueError("La variable de entorno GOOGLE_SERVICE_ACCOUNT no está configurada")
+
+    sa_json = base64.b64decode(encoded_sa).decode('utf-8')
+    sa_dict = json.loads(sa_json)
+
+    return service_account.Credentials.from_service_account_info(sa_dict, scopes=SCOPES)
+
+
+def _authorized_http(credentials):
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+
+
+class AuthorizedHttpPool:
+    """
+    Pool acotado de AuthorizedHttp. httplib2.Http no es thread-safe, así que cada
+    petición toma uno en exclusiva mientras dura y luego lo devuelve con su conexión
+    TCP+TLS abierta; Streamlit usa un hilo nuevo por rerun y no serviría uno por hilo.
+    """
+
+    def __init__(self, credentials, size=GOOGLE_HTTP_POOL_SIZE):
+        self.credentials = credentials
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def checkout(self):
+        self._slots.acquire()
+        try:
+            try:
+                # LIFO: el último devuelto es el que más probablemente sigue conectado
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                http = _authorized_http(self.credentials)
+            yield http
+            # Si la petición falló no se llega aquí: la conexión puede haber quedado a medias
+            self._idle.put(http)
+        finally:
+            self._slots.release()
+
+    def request(self, *args, **kwargs):
+        """Interfaz de httplib2.Http para quien usa `request.http` directamente."""
+        with self.checkout() as http:
+            return http.request(*args, **kwargs)
+
+    def stats(self):
+        return {'idle': self._idle.qsize()}
+
+
+class RateLimitedHttpRequest(HttpRequest):
+    """HttpRequest que toma un token de cuota de su API y un transporte del pool."""
+
+    def execute(self, http=None, num_retries=0):
+        acquire(api_name(self.methodId), method_class(self.method))
+        if http is None and isinstance(self.http, AuthorizedHttpPool):
+            with self.http.checkout() as pooled:
+                return super().execute(http=pooled, num_retries=num_retries)
+        return super().execute(http=http, num_retries=num_retries)
+
+
+def _request_builder(pool):
+    # El servicio se comparte entre sesiones; cada petición usa un transporte del pool
+    def build_request(http, *args, **kwargs):
+        return RateLimitedHttpRequest(pool, *args, **kwargs)
+    return build_request
+
+
+class GoogleClients:
+    """Credenciales y servicios de Drive y Sheets construidos una sola vez."""
+
+    def __init__(self, credentials, drive, sheets):
+        self.credentials = credentials
+        self.drive = drive
+        self.sheets = sheets
+        self.created_at = datetime.now()
+        self._created_monotonic = time.monotonic()
+
+    @property
+    def age(self):
+        """Segundos desde que se construyeron los clientes."""
+        return time.monotonic() - self._created_monotonic
+
+    @classmethod
+    def from_environment(cls):
+        credentials = load_service_account_credentials()
+        pool = AuthorizedHttpPool(credentials)
+        request_builder = _request_builder(pool)
+
+        # Sin round-trip de descubrimiento: los clientes salen de los JSON fijados
+        drive_service = build_from_document(
+            load_discovery_document('drive', 'v3'),
+            http=pool,
+            requestBuilder=request_builder)
+        sheets_service = build_from_document(
+            load_discovery_document('sheets', 'v4'),
+            http=pool,
+            requestBuilder=request_builder)
+
+        return cls(credentials, drive_service, sheets_service)
+
+
+class GoogleClientRegistry:
+    """Registro thread-safe que construye los clientes bajo demanda y los reutiliza."""
+
+    def __init__(self, factory=GoogleClients.from_environment, max_age=CLIENTS_MAX_AGE):
+        self._factory = factory
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._clients = None
+        self._build_count = 0
+        self._last_error = None
+        self._last_error_at = None
+        self._discovery_warnings = None
+
+    def _is_fresh(self, clients):
+        return clients is not None and (not self._max_age or clients.age < self._max_age)
+
+    def get(self):
+        clients = self._clients
+        if self._is_fresh(clients):
+            return clients
+
+        with self._lock:
+            # Otra sesión puede haberlos construido mientras esperábamos el lock
+            if self._is_fresh(self._clients):
+                return self._clients
+            if self._discovery_warnings is None:
+                self._discovery_warnings = check_discovery_documents()
+            try:
+                self._clients = self._factory()
+            except Exception as e:
+                self._last_error = str(e)
+                self._last_error_at = datetime.now()
+                raise
+            self._build_count += 1
+            self._last_error = None
+            return self._clients
+
+    def invalidate(self):
+        with self._lock:
+            self._clients = None
+
+    def health(self):
+        clients = self._clients
+        status = {
+            'ready': clients is not None,
+            'build_count': self._build_count,
+            'last_error': self._last_error,
+            'last_error_at': self._last_error_at.isoformat() if self._last_error_at else None,
+            'created_at': None,
+            'age_seconds': None,
+            'credentials_valid': None,
+            'token_expiry': None,
+            'discovery_warnings': self._discovery_warnings,
+        }
+        if clients is not None:
+            status['created_at'] = clients.created_at.isoformat()
+            status['age_seconds'] = round(clients.age, 1)
+            status['credentials_valid'] = clients.credentials.valid
+            expiry = clients.credentials.expiry
+            status['token_expiry'] = expiry.isoformat() if expiry else None
+        return status
+
+
+_registry = GoogleClientRegistry()
+
+
+def get_registry():
+    return _registry
+
+
+def get_google_clients():
+    return _registry.get()
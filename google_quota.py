@@ -0,0 +1,147 @@
+"""Cubos de tokens por cuota de Google (Drive, lecturas y escrituras de Sheets); las escrituras tienen prioridad."""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+READ = 'read'
+WRITE = 'write'
+
+# Un cubo por cuota real de Google, en peticiones por minuto (0 = sin límite).
+# Drive comparte una sola cuota de consultas; Sheets separa lecturas y escrituras.
+QUOTA_BUDGETS = {
+    'drive': float(os.getenv('GOOGLE_QUOTA_DRIVE_QUERIES_PER_MINUTE', '12000')),
+    'sheets.read': float(os.getenv('GOOGLE_QUOTA_SHEETS_READS_PER_MINUTE', '60')),
+    'sheets.write': float(os.getenv('GOOGLE_QUOTA_SHEETS_WRITES_PER_MINUTE', '60')),
+}
+# Menor valor = se atiende antes cuando lecturas y escrituras comparten cubo
+PRIORITY = {WRITE: 0, READ: 1}
+# Segundos de presupuesto que se pueden gastar de golpe
+QUOTA_BURST_SECONDS = float(os.getenv('GOOGLE_QUOTA_BURST_SECONDS', '10'))
+# Esperas más largas que esto se registran en el log
+QUOTA_LOG_WAIT_SECONDS = float(os.getenv('GOOGLE_QUOTA_LOG_WAIT_SECONDS', '1'))
+
+
+def method_class(http_method):
+    """GET cuenta como lectura; POST, PUT, PATCH y DELETE como escritura."""
+    return READ if http_method.upper() == 'GET' else WRITE
+
+
+def api_name(method_id):
+    """'sheets.spreadsheets.values.append' -> 'sheets'."""
+    return (method_id or '').split('.', 1)[0]
+
+
+class TokenBucket:
+    """Cubo de `rate_per_minute` tokens por minuto con capacidad de `burst_seconds`."""
+
+    def __init__(self, rate_per_minute, burst_seconds=QUOTA_BURST_SECONDS):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self):
+        """Toma un token si hay; si no, devuelve los segundos hasta el siguiente."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Cubos por cuota; cada cubo atiende a sus esperas por prioridad y orden de llegada."""
+
+    def __init__(self, budgets=QUOTA_BUDGETS, burst_seconds=QUOTA_BURST_SECONDS):
+        self._cond = threading.Condition()
+        self._buckets = {name: TokenBucket(rate, burst_seconds) for name, rate in budgets.items() if rate > 0}
+        self._waiters = {name: [] for name in self._buckets}
+        self._sequence = itertools.count()
+        self._metrics = {}
+
+    def bucket_for(self, api, klass):
+        """Cubo de la cuota que consume una llamada: el de su clase o el común de la API."""
+        for name in (f"{api}.{klass}", api):
+            if name in self._buckets:
+                return name
+        return None
+
+    def acquire(self, api, klass):
+        """Bloquea hasta obtener un token; devuelve los segundos esperados."""
+        name = self.bucket_for(api, klass)
+        if name is None:
+            return 0.0
+        bucket = self._buckets[name]
+        waiters = self._waiters[name]
+        started = time.monotonic()
+        with self._cond:
+            ticket = (PRIORITY[klass], next(self._sequence))
+            heapq.heappush(waiters, ticket)
+            try:
+                while True:
+                    if waiters[0] != ticket:
+                        # Solo el primero de la cola consume tokens; el resto espera su turno
+                        self._cond.wait()
+                        continue
+                    delay = bucket.take()
+                    if not delay:
+                        break
+                    self._cond.wait(delay)
+            finally:
+                waiters.remove(ticket)
+                heapq.heapify(waiters)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            metrics = self._metrics.setdefault(f"{api}.{klass}", {
+                'bucket': name, 'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0})
+            metrics['acquired'] += 1
+            if waited > 0.001:
+                metrics['waited'] += 1
+                metrics['wait_seconds'] += waited
+                metrics['max_wait_seconds'] = max(metrics['max_wait_seconds'], waited)
+        if waited >= QUOTA_LOG_WAIT_SECONDS:
+            logger.info("Waited %.1fs for %s quota (%s %s)", waited, name, api, klass)
+        return waited
+
+    def stats(self):
+        with self._cond:
+            buckets = {}
+            for name, bucket in self._buckets.items():
+                bucket._refill()
+                buckets[name] = {
+                    'per_minute': bucket.rate * 60,
+                    'tokens': round(bucket.tokens, 2),
+                    'waiting': len(self._waiters[name]),
+                }
+            calls = {
+                key: dict(metrics, wait_seconds=round(metrics['wait_seconds'], 3),
+                          max_wait_seconds=round(metrics['max_wait_seconds'], 3))
+                for key, metrics in self._metrics.items()
+            }
+            return {'buckets': buckets, 'calls': calls}
+
+
+_limiter = RateLimiter()
+
+
+def get_rate_limiter():
+    return _limiter
+
+
+def acquire(api, klass):
+    return _limiter.acquire(api, klass)
+
+
+def quota_stats():
+    return _limiter.stats()
@@ -0,0 +1,187 @@
+"""Genera variantes redimensionadas de IMAGES/ de forma incremental.
+
+Uso: python image_derivatives.py --widths 400 800 --formats jpeg webp
+"""
+
+import io
+import os
+import sys
+import json
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from local_cache import CACHE_DIR, file_digest
+
+IMAGES_DIR = Path(__file__).parent / "IMAGES"
+IMAGE_FOLDERS = ('neutral', 'older')
+
+DERIVATIVES_DIR = Path(os.getenv('FALLING_WALLS_DERIVATIVES_DIR', CACHE_DIR / "derivatives"))
+MANIFEST_NAME = "derivatives.json"
+
+DEFAULT_WIDTHS = (400, 800)
+DEFAULT_FORMATS = ('jpeg', 'webp')
+QUALITY = {'jpeg': 85, 'webp': 80}
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def variant_name(relpath, width, fmt):
+    stem = Path(relpath).with_suffix('')
+    return f"{stem}.{width}.{EXTENSIONS[fmt]}"
+
+
+def _atomic_write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build_variants(source_path, relpath, out_dir, widths, formats):
+    """Genera las variantes de un original. Se ejecuta en un proceso del pool."""
+    variants = {}
+    with Image.open(source_path) as image:
+        image = image.convert('RGB')
+        original_width = image.width
+        for width in sorted(set(widths)):
+            if width >= original_width:
+                continue
+            height = round(image.height * width / original_width)
+            resized = image.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, format=fmt.upper(), quality=QUALITY[fmt], optimize=True)
+                name = variant_name(relpath, width, fmt)
+                _atomic_write(Path(out_dir) / name, buffer.getvalue())
+                variants[f"{width}.{fmt}"] = name
+    return variants, original_width
+
+
+def load_manifest(out_dir=DERIVATIVES_DIR):
+    try:
+        with open(Path(out_dir) / MANIFEST_NAME, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest, out_dir):
+    _atomic_write(Path(out_dir) / MANIFEST_NAME, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+
+
+def _is_current(entry, sha256, out_dir, widths, formats):
+    if entry is None or entry.get('sha256') != sha256:
+        return False
+    expected = {f"{w}.{fmt}" for w in widths if w < entry['width'] for fmt in formats}
+    variants = entry.get('variants', {})
+    return expected <= set(variants) and all((Path(out_dir) / variants[k]).exists() for k in expected)
+
+
+def build(images_dir=IMAGES_DIR, out_dir=DERIVATIVES_DIR, widths=DEFAULT_WIDTHS,
+          formats=DEFAULT_FORMATS, workers=None):
+    """Regenera solo los originales que cambiaron. Devuelve (generados, sin cambios)."""
+    images_dir, out_dir = Path(images_dir), Path(out_dir)
+    manifest = load_manifest(out_dir)
+    pending = {}
+    unchanged = 0
+
+    for folder in IMAGE_FOLDERS:
+        for source_path in sorted((images_dir / folder).glob("*.jpg")):
+            relpath = f"{folder}/{source_path.name}"
+            stat = source_path.stat()
+            sha256 = file_digest(source_path, 'sha256')
+            entry = manifest.get(relpath)
+            if _is_current(entry, sha256, out_dir, widths, formats):
+                # Misma imagen: solo actualizamos los datos baratos de validación
+                entry['mtime_ns'], entry['size'] = stat.st_mtime_ns, stat.st_size
+                unchanged += 1
+                continue
+            pending[relpath] = (source_path, sha256, stat)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            relpath: executor.submit(build_variants, source_path, relpath, out_dir, widths, formats)
+            for relpath, (source_path, _, _) in pending.items()
+        }
+        for relpath, future in futures.items():
+            variants, original_width = future.result()
+            _, sha256, stat = pending[relpath]
+            manifest[relpath] = {
+                'sha256': sha256,
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'width': original_width,
+                'variants': variants,
+            }
+
+    # Originales que ya no existen
+    for relpath in [r for r in manifest if not (images_dir / r).exists()]:
+        del manifest[relpath]
+
+    _save_manifest(manifest, out_dir)
+    return len(pending), unchanged
+
+
+class DerivativeIndex:
+    """Consulta de variantes para la app; recarga el manifiesto si el build lo reescribe."""
+
+    def __init__(self, images_dir=IMAGES_DIR, out_dir=DERIVATIVES_DIR):
+        self.images_dir = Path(images_dir)
+        self.out_dir = Path(out_dir)
+        self._lock = threading.Lock()
+        self._manifest = {}
+        self._manifest_mtime = None
+
+    def _current_manifest(self):
+        try:
+            mtime = (self.out_dir / MANIFEST_NAME).stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                self._manifest = load_manifest(self.out_dir)
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def best_variant(self, relpath, width, fmt='jpeg'):
+        """Ruta de la variante más pequeña con ancho >= `width`, o None si no hay ninguna válida."""
+        entry = self._current_manifest().get(relpath)
+        if entry is None:
+            return None
+        try:
+            stat = (self.images_dir / relpath).stat()
+        except FileNotFoundError:
+            return None
+        # El original cambió después del último build: la variante ya no vale
+        if (stat.st_mtime_ns, stat.st_size) != (entry['mtime_ns'], entry['size']):
+            return None
+        candidates = sorted(
+            int(key.split('.')[0]) for key in entry['variants'] if key.endswith(f".{fmt}")
+        )
+        fitting = [w for w in candidates if w >= width]
+        if not fitting:
+            return None
+        path = self.out_dir / entry['variants'][f"{fitting[0]}.{fmt}"]
+        return path if path.exists() else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera variantes redimensionadas de las imágenes de IMAGES/.")
+    parser.add_argument('--images-dir', type=Path, default=IMAGES_DIR)
+    parser.add_argument('--out-dir', type=Path, default=DERIVATIVES_DIR)
+    parser.add_argument('--widths', type=int, nargs='+', default=list(DEFAULT_WIDTHS))
+    parser.add_argument('--formats', nargs='+', choices=sorted(QUALITY), default=list(DEFAULT_FORMATS))
+    parser.add_argument('--workers', type=int, default=None, help="Procesos del pool (por defecto, uno por CPU)")
+    args = parser.parse_args(argv)
+
+    generated, unchanged = build(args.images_dir, args.out_dir, args.widths, args.formats, args.workers)
+    print(f"{generated} imágenes regeneradas, {unchanged} sin cambios -> {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Precarga en segundo plano de las imágenes de la sesión en la caché compartida."""
+
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from image_sources import DISPLAY_MAX_WIDTH, IMAGE_TYPES, get_image_cache
+
+logger = logging.getLogger(__name__)
+
+# Hilos compartidos por todas las sesiones del proceso
+PREFETCH_WORKERS = int(os.getenv('IMAGE_PREFETCH_WORKERS', '4'))
+# Segundos que el render espera a su precarga antes de cargar la imagen él mismo
+PREFETCH_WAIT_SECONDS = float(os.getenv('IMAGE_PREFETCH_WAIT_SECONDS', '2'))
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="image-prefetch")
+
+
+class SessionPrefetch:
+    """Precarga en segundo plano cada (prompt, image_type) de la sesión."""
+
+    def __init__(self, prompts, source, width=DISPLAY_MAX_WIDTH, cache=None):
+        self.prompts = list(prompts)
+        self.source = source
+        self.width = width
+        self.cache = cache or get_image_cache()
+        self._futures = {
+            (prompt, image_type): _executor.submit(self._warm, prompt, image_type)
+            for prompt in self.prompts
+            for image_type in IMAGE_TYPES
+        }
+
+    def _warm(self, prompt, image_type):
+        # No devolvemos los bytes: el futuro no debe retener una copia por sesión
+        self.cache.get(self.source, prompt, image_type, self.width)
+
+    def get(self, prompt, image_type, timeout=PREFETCH_WAIT_SECONDS):
+        """
+        Bytes JPEG de la imagen, o None si no se pudo cargar. Si ya están en memoria se
+        devuelven sin esperar; si la precarga sigue en cola detrás de otras sesiones o
+        tarda más de `timeout`, la imagen se carga en el hilo del script.
+        """
+        data = self.cache.peek(self.source, prompt, image_type, self.width)
+        if data is not None:
+            return data
+        future = self._futures.get((prompt, image_type))
+        try:
+            # cancel() solo tiene éxito si el trabajo aún no había empezado
+            if future is not None and not future.cancel():
+                try:
+                    future.result(timeout=timeout)
+                except TimeoutError:
+                    logger.warning("Prefetch of %s image for '%s' still running after %.1fs, loading inline",
+                                   image_type, prompt, timeout)
+            return self.cache.get(self.source, prompt, image_type, self.width)
+        except Exception as e:
+            logger.warning("Could not load %s image for '%s': %s", image_type, prompt, e)
+            return None
+
+    def ready(self):
+        return all(future.done() for future in self._futures.values())
+
+    def cancel(self):
+        for future in self._futures.values():
+            future.cancel()
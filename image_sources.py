@@ -0,0 +1,270 @@
+"""Orígenes de imágenes (local o Drive) y la caché por niveles que tienen delante."""
+
+import io
+import os
+import hashlib
+from abc import ABC, abstractmethod
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image
+
+from drive_catalog import IMAGE_PREFIXES, format_prompt, get_drive_image_index
+from drive_downloads import download_drive_file
+from google_clients import get_google_clients
+from image_derivatives import DerivativeIndex
+from local_cache import CACHE_DIR, DiskLRUCache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = ('neutral', 'older')
+
+# Origen de las imágenes: 'local' (carpeta IMAGES/) o 'drive'
+IMAGE_SOURCE = os.getenv('IMAGE_SOURCE', 'local')
+
+# Ancho máximo (px) con el que se codifican las imágenes para mostrarlas
+DISPLAY_MAX_WIDTH = int(os.getenv('IMAGE_DISPLAY_MAX_WIDTH', '800'))
+DISPLAY_JPEG_QUALITY = 85
+
+# Presupuestos de los niveles de caché
+MEMORY_CACHE_MAX_BYTES = int(float(os.getenv('IMAGE_MEMORY_CACHE_MB', '64')) * 1024 * 1024)
+DISK_CACHE_MAX_BYTES = int(float(os.getenv('IMAGE_DISK_CACHE_MB', '256')) * 1024 * 1024)
+DISPLAY_CACHE_DIR = CACHE_DIR / "display"
+
+
+def image_filename(prompt, image_type):
+    return f"{IMAGE_PREFIXES[image_type]}{format_prompt(prompt)}.jpg"
+
+
+def encode_for_display(path, max_width=DISPLAY_MAX_WIDTH):
+    """Decodifica la imagen, la reduce a `max_width` y la devuelve como bytes JPEG."""
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        if image.width > max_width:
+            height = round(image.height * max_width / image.width)
+            image = image.resize((max_width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=DISPLAY_JPEG_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+
+class ImageSource(ABC):
+    """Interfaz común de los orígenes de imágenes."""
+
+    name = None
+
+    @abstractmethod
+    def version_key(self, prompt, image_type):
+        """Clave que cambia cuando cambia el original; FileNotFoundError si no existe."""
+
+    @abstractmethod
+    def fetch(self, prompt, image_type):
+        """Ruta local del original (descargándolo si hace falta)."""
+
+    def variant(self, prompt, image_type, width):
+        """Ruta de una variante JPEG ya generada de al menos `width` px, o None."""
+        return None
+
+    def exists(self, prompt, image_type):
+        try:
+            self.version_key(prompt, image_type)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class LocalImageSource(ImageSource):
+    name = 'local'
+
+    def __init__(self, base_folder=Path(__file__).parent / "IMAGES", derivatives=None):
+        self.base_folder = Path(base_folder)
+        self.derivatives = derivatives or DerivativeIndex(self.base_folder)
+
+    def _path(self, prompt, image_type):
+        return self.base_folder / image_type / image_filename(prompt, image_type)
+
+    def version_key(self, prompt, image_type):
+        path = self._path(prompt, image_type)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No se encontró la imagen {image_type} para el prompt '{prompt}'.")
+        return f"local:{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def fetch(self, prompt, image_type):
+        return self._path(prompt, image_type)
+
+    def variant(self, prompt, image_type, width):
+        # st.image vuelve a codificar cualquier formato que no sea JPEG/PNG/GIF,
+        # así que aquí solo sirven las variantes JPEG; las WebP son para HTML
+        return self.derivatives.best_variant(f"{image_type}/{image_filename(prompt, image_type)}", width, 'jpeg')
+
+
+class DriveImageSource(ImageSource):
+    name = 'drive'
+
+    def _file(self, prompt, image_type):
+        file = get_drive_image_index(get_google_clients().drive).get(prompt, image_type)
+        if file is None:
+            raise FileNotFoundError(f"No se encontró la imagen {image_type} para el prompt '{prompt}' en Google Drive.")
+        return file
+
+    def version_key(self, prompt, image_type):
+        file = self._file(prompt, image_type)
+        return f"drive:{file['id']}:{file.get('md5Checksum') or file.get('modifiedTime')}"
+
+    def fetch(self, prompt, image_type):
+        file = self._file(prompt, image_type)
+        return download_drive_file(get_google_clients().drive, file['id'], file.get('md5Checksum'))
+
+
+class ImagePair:
+    """
+    Par neutral/older de un prompt que no abre ningún archivo hasta que se
+    piden los píxeles; los bytes salen de la caché por niveles.
+    """
+
+    def __init__(self, source, prompt, cache=None):
+        self.source = source
+        self.prompt = prompt
+        self._cache = cache
+
+    def missing(self):
+        return [image_type for image_type in IMAGE_TYPES
+                if not self.source.exists(self.prompt, image_type)]
+
+    def __contains__(self, image_type):
+        return image_type in IMAGE_TYPES and self.source.exists(self.prompt, image_type)
+
+    def __getitem__(self, image_type):
+        """Bytes JPEG listos para mostrar."""
+        return self.get(image_type)
+
+    def get(self, image_type, width=None):
+        if image_type not in IMAGE_TYPES:
+            raise KeyError(image_type)
+        return (self._cache or get_image_cache()).get(self.source, self.prompt, image_type, width)
+
+
+class TieredImageCache:
+    """Memoria (bytes listos) -> variantes pre-generadas -> disco (JPEG codificados) -> origen."""
+
+    def __init__(self, memory_max_bytes=MEMORY_CACHE_MAX_BYTES, disk_cache=None, max_width=DISPLAY_MAX_WIDTH):
+        self.memory_max_bytes = memory_max_bytes
+        self.max_width = max_width
+        self.disk = disk_cache or DiskLRUCache(DISPLAY_CACHE_DIR, DISK_CACHE_MAX_BYTES)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self.counters = {'memory_hits': 0, 'derivative_hits': 0, 'disk_hits': 0, 'source_fetches': 0, 'errors': 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _key(self, source, prompt, image_type, width):
+        # La versión incluye ruta y mtime (local) o md5 (Drive): un original nuevo es otra clave
+        version = source.version_key(prompt, image_type)
+        return hashlib.sha1(f"{version}|{width or self.max_width}".encode('utf-8')).hexdigest()
+
+    def peek(self, source, prompt, image_type, width=None):
+        """Bytes del nivel de memoria, o None sin esperar a ningún otro nivel."""
+        try:
+            key = self._key(source, prompt, image_type, width)
+        except Exception:
+            return None
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+            return data
+
+    def get(self, source, prompt, image_type, width=None):
+        """Bytes JPEG de ancho máximo `width`, compartidos por todas las sesiones."""
+        width = width or self.max_width
+        try:
+            key = self._key(source, prompt, image_type, width)
+        except Exception:
+            self._count('errors')
+            raise
+
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return data
+
+        # Una sola sesión codifica cada clave; las demás esperan y leen el resultado
+        with self.disk.key_lock(key):
+            with self._lock:
+                data = self._memory.get(key)
+            if data is not None:
+                self._count('memory_hits')
+                return data
+            # Las variantes ya están en disco: no se duplican en la caché de codificados
+            variant = source.variant(prompt, image_type, width)
+            path = self.disk.get(key) if variant is None else None
+            if variant is not None:
+                data = variant.read_bytes()
+                self._count('derivative_hits')
+            elif path is not None:
+                data = path.read_bytes()
+                self._count('disk_hits')
+            else:
+                try:
+                    data = encode_for_display(source.fetch(prompt, image_type), width)
+                except Exception:
+                    self._count('errors')
+                    raise
+                self._count('source_fetches')
+                self.disk.put(key, data)
+            self._remember(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_items'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['memory_max_bytes'] = self.memory_max_bytes
+        stats['disk'] = self.disk.stats()
+        return stats
+
+
+_sources = {}
+_image_cache = None
+_lock = threading.Lock()
+
+
+def get_image_source(name=IMAGE_SOURCE):
+    with _lock:
+        if name not in _sources:
+            if name == 'drive':
+                _sources[name] = DriveImageSource()
+            elif name == 'local':
+                _sources[name] = LocalImageSource()
+            else:
+                raise ValueError(f"Origen de imágenes desconocido: '{name}'")
+        return _sources[name]
+
+
+def get_image_cache():
+    global _image_cache
+    with _lock:
+        if _image_cache is None:
+            _image_cache = TieredImageCache()
+        return _image_cache
@@ -0,0 +1,171 @@
+"""Directorio de la caché local (.cache/), su caché LRU en disco y utilidades comunes de sus archivos."""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv('FALLING_WALLS_CACHE_DIR', Path(__file__).parent / ".cache"))
+
+
+def file_digest(path, algorithm='md5', chunk_size=1024 * 1024):
+    """Hash hexadecimal del archivo, leído por bloques."""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskLRUCache:
+    """
+    Caché LRU en disco indexada por claves hexadecimales (un archivo por clave).
+    Con `verify_md5=True` la clave es el md5 del contenido y se comprueba al guardar.
+    """
+
+    def __init__(self, directory, max_bytes, verify_md5=False, partial_max_age_hours=24):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.verify_md5 = verify_md5
+        self.partial_max_age_hours = partial_max_age_hours
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        # clave -> [lock, sesiones que lo usan o esperan]; se borra al salir la última
+        self._inflight = {}
+        # .part de escrituras anteriores: cuentan para el presupuesto hasta que se reanudan
+        self._partials = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._scan()
+
+    def _scan(self):
+        if not self.directory.exists():
+            return
+        found = []
+        stale_before = time.time() - self.partial_max_age_hours * 3600
+        for path in self.directory.glob("*/*"):
+            stat = path.stat()
+            if path.suffix == '.tmp':
+                # Escrituras interrumpidas
+                path.unlink(missing_ok=True)
+            elif path.suffix == '.part':
+                # Se conservan para reanudar, salvo las que llevan demasiado tiempo abandonadas
+                if stat.st_mtime < stale_before:
+                    path.unlink(missing_ok=True)
+                else:
+                    self._partials[path.name[1:-len('.part')]] = stat.st_size
+                    self._total_bytes += stat.st_size
+            elif not path.name.startswith('.'):
+                found.append((stat.st_mtime, path.name, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def path_for(self, key):
+        return self.directory / key[:2] / key
+
+    def get(self, key, count=True):
+        """Devuelve la ruta del archivo cacheado o None."""
+        with self._lock:
+            if key not in self._entries:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Lo borraron desde fuera: lo olvidamos
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+            return None
+        return path
+
+    def put_file(self, key, tmp_path):
+        """Mueve atómicamente `tmp_path` a la caché (tras verificar su md5 si se pidió)."""
+        if self.verify_md5:
+            actual = file_digest(tmp_path)
+            if actual != key:
+                os.unlink(tmp_path)
+                raise ValueError(f"md5 inesperado: se esperaba {key} y se obtuvo {actual}")
+        path = self.path_for(key)
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+        return path
+
+    def put(self, key, data):
+        return self.put_file(key, self._write_temp(key, data))
+
+    def partial_path_for(self, key):
+        """Ruta del .part de `key`; deja de contarse aparte porque se va a reanudar."""
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._total_bytes -= self._partials.pop(key, 0)
+        return path.with_name(f".{key}.part")
+
+    def _write_temp(self, key, data):
+        folder = self.path_for(key).parent
+        folder.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{key}.", suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return tmp_path
+
+    def _evict(self):
+        # Primero los .part abandonados: valen menos que un archivo completo
+        while self._total_bytes > self.max_bytes and self._partials:
+            key, size = self._partials.popitem()
+            self._total_bytes -= size
+            self.evictions += 1
+            self.path_for(key).with_name(f".{key}.part").unlink(missing_ok=True)
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def key_lock(self, key):
+        """Lock por clave para que dos sesiones no generen el mismo archivo a la vez."""
+        with self._lock:
+            entry = self._inflight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'partial_files': len(self._partials),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,73 @@
+"""Fondo de partículas como componente de Streamlit empaquetado, con modo adaptativo según los FPS."""
+
+import os
+import logging
+import threading
+from pathlib import Path
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+logger = logging.getLogger(__name__)
+
+FRONTEND_DIR = Path(__file__).parent / "components" / "particles"
+
+# Partículas por cada 800.000 px² (como la "density" de particles.js)
+PARTICLES_COUNT = int(os.getenv('PARTICLES_COUNT', '300'))
+# Modo adaptativo y FPS que intenta mantener
+PARTICLES_ADAPTIVE = os.getenv('PARTICLES_ADAPTIVE', '1') == '1'
+PARTICLES_TARGET_FPS = int(os.getenv('PARTICLES_TARGET_FPS', '30'))
+
+_particles = components.declare_component("particles", path=str(FRONTEND_DIR))
+
+
+class ParticleMetrics:
+    """Agregado por proceso de los FPS que informan los navegadores."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reports = 0
+        self.fps_sum = 0.0
+        self.fps_min = None
+        self.scale_min = None
+        self.last = {}
+
+    def record(self, key, value):
+        with self._lock:
+            self.reports += 1
+            self.fps_sum += value['fps']
+            self.fps_min = value['fps'] if self.fps_min is None else min(self.fps_min, value['fps'])
+            self.scale_min = value['scale'] if self.scale_min is None else min(self.scale_min, value['scale'])
+            self.last[key] = value
+
+    def stats(self):
+        with self._lock:
+            return {
+                'reports': self.reports,
+                'fps_avg': round(self.fps_sum / self.reports, 1) if self.reports else None,
+                'fps_min': self.fps_min,
+                'scale_min': self.scale_min,
+                'last': dict(self.last),
+            }
+
+
+_metrics = ParticleMetrics()
+
+
+def particles_stats():
+    return _metrics.stats()
+
+
+def particles_background(height, key, count=PARTICLES_COUNT, adaptive=PARTICLES_ADAPTIVE,
+                         target_fps=PARTICLES_TARGET_FPS):
+    """Monta el fondo de partículas; con la misma `key` se reutiliza el iframe existente."""
+    value = _particles(height=height, count=count, adaptive=adaptive, target_fps=target_fps,
+                       key=key, default=None)
+    # El componente devuelve su último valor en cada rerun: cada informe se registra una vez
+    seen_key = f"{key}_reported_seq"
+    if value and value.get('seq', 0) > st.session_state.get(seen_key, 0):
+        st.session_state[seen_key] = value['seq']
+        _metrics.record(key, value)
+        logger.info("Particles %s: %.1f fps with %s particles (scale %.2f)",
+                    key, value['fps'], value['particles'], value['scale'])
+    return value
@@ -0,0 +1,77 @@
+"""Respuestas de una sesión: etiquetas como bitmask y palabras por (prompt, tipo de imagen, paso)."""
+
+# Orden fijo de las etiquetas: el bit i corresponde a la opción i en cualquier idioma
+TAG_OPTIONS = ("Vulnerable", "Strong", "Hallucinated", "Realistic", "Passive", "Active",
+               "Weak", "Capable", "Relaxed", "Worried")
+IMAGE_TYPES = ('neutral', 'older')
+
+
+class ImageResponse:
+    """Etiquetas (bitmask) y palabras de una imagen en un paso."""
+
+    __slots__ = ('tags', 'words')
+
+    def __init__(self):
+        self.tags = 0
+        self.words = None
+
+    def has_tag(self, index):
+        return bool(self.tags >> index & 1)
+
+    def toggle_tag(self, index):
+        self.tags ^= 1 << index
+
+    def tag_names(self, options=TAG_OPTIONS):
+        return [option for i, option in enumerate(options) if self.tags >> i & 1]
+
+    def add_word(self, word):
+        if self.words is None:
+            self.words = []
+        if word not in self.words:
+            self.words.append(word)
+
+    def word_list(self):
+        return list(self.words or ())
+
+
+class SessionResponses:
+    """Respuestas de una sesión indexadas por (prompt, tipo de imagen, paso)."""
+
+    __slots__ = ('_records',)
+
+    def __init__(self):
+        self._records = {}
+
+    @staticmethod
+    def key(prompt_index, image_type, step):
+        # El paso (1-3) ocupa 2 bits y el tipo de imagen 1
+        return prompt_index << 3 | IMAGE_TYPES.index(image_type) << 2 | step
+
+    def get(self, prompt_index, image_type, step):
+        """Registro de la imagen en ese paso; se crea vacío la primera vez."""
+        key = self.key(prompt_index, image_type, step)
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = ImageResponse()
+        return record
+
+    def __iter__(self):
+        """Genera (prompt_index, image_type, step, record) en el orden en que se respondieron."""
+        for key in self._records:
+            yield key >> 3, IMAGE_TYPES[key >> 2 & 1], key & 3, self._records[key]
+
+    def __len__(self):
+        return len(self._records)
+
+
+def response_rows(responses, prompts, tag_options=TAG_OPTIONS, step_label="Step {}"):
+    """(prompt, image_type, step_key, tags, words) de cada registro, con el formato de la hoja."""
+    for prompt_index, image_type, step, record in responses:
+        yield (
+            # Mismo formato que los nombres de archivo (espacios -> "_")
+            prompts[prompt_index].replace(" ", "_"),
+            image_type,
+            step_label.format(step),
+            "|".join(record.tag_names(tag_options)),
+            "|".join(record.word_list()),
+        )
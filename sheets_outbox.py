@@ -0,0 +1,171 @@
+"""Outbox local en SQLite (WAL) de las filas para Sheets, con clave idempotente y lotes reclamados por lease.
+
+Entrega al menos una vez: si el proceso cae tras el append y antes de marcar el lote, se reenvía.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from local_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PATH = Path(os.getenv('SHEETS_OUTBOX_PATH', CACHE_DIR / "sheets_outbox.sqlite3"))
+# Días que se conservan las filas ya enviadas (sirven para descartar duplicados)
+OUTBOX_RETENTION_DAYS = float(os.getenv('SHEETS_OUTBOX_RETENTION_DAYS', '30'))
+
+# Segundos que un proceso retiene un lote reclamado; después otro puede reclamarlo
+OUTBOX_LEASE_SECONDS = float(os.getenv('SHEETS_OUTBOX_LEASE_SECONDS', '300'))
+
+# Columnas que identifican una fila: user_id, prompt, image_type, step
+ROW_KEY_COLUMNS = (0, 3, 4, 5)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    row_key TEXT NOT NULL UNIQUE,
+    spreadsheet_id TEXT NOT NULL,
+    row TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    claimed_by TEXT,
+    claimed_until REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (id) WHERE sent_at IS NULL;
+"""
+
+# Columnas añadidas después de la primera versión del outbox
+MIGRATIONS = (
+    ('claimed_by', "ALTER TABLE outbox ADD COLUMN claimed_by TEXT"),
+    ('claimed_until', "ALTER TABLE outbox ADD COLUMN claimed_until REAL"),
+)
+
+# Filas pendientes que nadie tiene reclamadas (o cuyo lease expiró)
+CLAIMABLE = "sent_at IS NULL AND (claimed_until IS NULL OR claimed_until < ?)"
+
+
+def row_key(spreadsheet_id, row, key_columns=ROW_KEY_COLUMNS):
+    """Clave estable de una fila; no incluye el timestamp, que cambia en cada envío."""
+    identity = [spreadsheet_id] + [row[i] if i < len(row) else None for i in key_columns]
+    return hashlib.sha256(json.dumps(identity, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class SheetsOutbox:
+    """Filas pendientes de subir a Sheets, guardadas en SQLite (WAL)."""
+
+    def __init__(self, path=OUTBOX_PATH, key_columns=ROW_KEY_COLUMNS, lease_seconds=OUTBOX_LEASE_SECONDS):
+        self.path = Path(path)
+        self.key_columns = key_columns
+        self.lease_seconds = lease_seconds
+        # Varios procesos (las tres apps) pueden compartir el archivo: cada uno reclama sus lotes
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Una sola conexión compartida entre las sesiones y el hilo de escritura
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL sobrevive a la caída del proceso sin un fsync por commit
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        for column, statement in MIGRATIONS:
+            if column not in columns:
+                self._conn.execute(statement)
+
+    def add(self, spreadsheet_id, values):
+        """Guarda las filas; devuelve cuántas eran nuevas (las repetidas se ignoran)."""
+        now = time.time()
+        records = [
+            (row_key(spreadsheet_id, row, self.key_columns), spreadsheet_id,
+             json.dumps(row, ensure_ascii=False), now)
+            for row in values
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO outbox (row_key, spreadsheet_id, row, created_at) "
+                    "VALUES (?, ?, ?, ?)", records)
+            return self._conn.total_changes - before
+
+    def claim_batch(self, limit):
+        """
+        Reclama las filas libres más antiguas de una misma hoja durante `lease_seconds`.
+        Devuelve (spreadsheet_id, ids, filas); ids vacío si no hay nada que reclamar.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            # BEGIN IMMEDIATE toma el lock de escritura: otro proceso no puede reclamar las mismas filas
+            self._conn.execute("BEGIN IMMEDIATE")
+            first = self._conn.execute(
+                f"SELECT spreadsheet_id FROM outbox WHERE {CLAIMABLE} ORDER BY id LIMIT 1", (now,)).fetchone()
+            if first is None:
+                return None, [], []
+            rows = self._conn.execute(
+                f"SELECT id, row FROM outbox WHERE {CLAIMABLE} AND spreadsheet_id = ? ORDER BY id LIMIT ?",
+                (now, first[0], limit)).fetchall()
+            self._conn.executemany("UPDATE outbox SET claimed_by = ?, claimed_until = ? WHERE id = ?",
+                                   [(self.owner, now + self.lease_seconds, row_id) for row_id, _ in rows])
+        return first[0], [row_id for row_id, _ in rows], [json.loads(row) for _, row in rows]
+
+    def mark_sent(self, ids):
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("UPDATE outbox SET sent_at = ?, last_error = NULL, claimed_until = NULL "
+                                   "WHERE id = ? AND claimed_by = ?",
+                                   [(time.time(), row_id, self.owner) for row_id in ids])
+
+    def mark_failed(self, ids, error):
+        """Suma un intento y libera el lease para que cualquier proceso lo reintente."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("UPDATE outbox SET attempts = attempts + 1, last_error = ?, "
+                                   "claimed_by = NULL, claimed_until = NULL WHERE id = ? AND claimed_by = ?",
+                                   [(error, row_id, self.owner) for row_id in ids])
+
+    def prune(self, retention_days=OUTBOX_RETENTION_DAYS):
+        """Borra las filas enviadas hace más de `retention_days` días."""
+        cutoff = time.time() - retention_days * 86400
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM outbox WHERE sent_at IS NOT NULL AND sent_at < ?", (cutoff,)).rowcount
+
+    def pending(self):
+        """(filas que se pueden reclamar, created_at de la más antigua o None)."""
+        with self._lock:
+            count, oldest = self._conn.execute(
+                f"SELECT COUNT(*), MIN(created_at) FROM outbox WHERE {CLAIMABLE}", (time.time(),)).fetchone()
+        return count, oldest
+
+    def next_lease_expiry(self):
+        """Cuándo expira el primer lease vigente de una fila sin enviar (o None)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(claimed_until) FROM outbox WHERE sent_at IS NULL AND claimed_until >= ?",
+                (time.time(),)).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            count, claimed, oldest = self._conn.execute(
+                "SELECT COUNT(*), SUM(claimed_until >= ?), MIN(created_at) FROM outbox WHERE sent_at IS NULL",
+                (time.time(),)).fetchone()
+        return {
+            'pending_rows': count,
+            'claimed_rows': claimed or 0,
+            'lag_seconds': round(time.time() - oldest, 1) if oldest is not None else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
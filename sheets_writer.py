@@ -0,0 +1,233 @@
+"""Hilo que sube a Sheets las filas del outbox, agrupando las de todas las sesiones en un append por intervalo."""
+
+import os
+import time
+import atexit
+import logging
+import threading
+
+from sheets_outbox import SheetsOutbox
+
+logger = logging.getLogger(__name__)
+
+SHEETS_RANGE = 'Sheet1!A1'
+
+# Un append por hoja cada N segundos o M filas, lo que llegue antes
+SHEETS_FLUSH_INTERVAL = float(os.getenv('SHEETS_FLUSH_INTERVAL', '10'))
+SHEETS_FLUSH_MAX_ROWS = int(os.getenv('SHEETS_FLUSH_MAX_ROWS', '500'))
+# Espera máxima (s) entre reintentos tras un append fallido
+SHEETS_RETRY_MAX_SECONDS = float(os.getenv('SHEETS_RETRY_MAX_SECONDS', '300'))
+# Espera máxima al vaciar lo pendiente al cerrar el proceso
+SHEETS_SHUTDOWN_TIMEOUT = float(os.getenv('SHEETS_SHUTDOWN_TIMEOUT', '30'))
+
+
+def append_rows(sheets_service, spreadsheet_id, values, range_=SHEETS_RANGE):
+    """Añade `values` al final de la hoja (llamada bloqueante)."""
+    return sheets_service.spreadsheets().values().append(
+        spreadsheetId=spreadsheet_id,
+        range=range_,
+        valueInputOption='USER_ENTERED',
+        insertDataOption='INSERT_ROWS',
+        body={'values': values}
+    ).execute()
+
+
+class SheetsWriter:
+    """Hilo que vacía el outbox en Sheets agrupando las filas de todas las sesiones."""
+
+    def __init__(self, outbox=None, flush_interval=SHEETS_FLUSH_INTERVAL,
+                 flush_max_rows=SHEETS_FLUSH_MAX_ROWS, retry_max_seconds=SHEETS_RETRY_MAX_SECONDS):
+        self.outbox = outbox if outbox is not None else SheetsOutbox()
+        self.flush_interval = flush_interval
+        self.flush_max_rows = flush_max_rows
+        self.retry_max_seconds = retry_max_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._sheets_service = None
+        self._failures = 0
+        self._retry_at = None
+        self._resumed = False
+        self.counters = {
+            'enqueued': 0,
+            'duplicates': 0,
+            'uploaded_rows': 0,
+            'flushes': 0,
+            'failed_uploads': 0,
+        }
+        self.last_error = None
+        self.last_upload_seconds = None
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def _ensure_worker(self, sheets_service):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Sheets writer is closed")
+            # El servicio es el mismo objeto compartido; nos quedamos con el más reciente
+            self._sheets_service = sheets_service
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, sheets_service, spreadsheet_id, values):
+        """Guarda las filas de una sesión en el outbox y avisa al hilo de escritura."""
+        values = list(values)
+        added = self.outbox.add(spreadsheet_id, values)
+        self._count('enqueued', added)
+        self._count('duplicates', len(values) - added)
+        self._ensure_worker(sheets_service)
+        # El hilo recalcula su espera: sube ya si hay lote completo
+        self._wake.set()
+
+    def resume(self, sheets_service):
+        """Arranca el hilo si quedaron filas sin subir de un proceso anterior (una vez por proceso)."""
+        if self._resumed:
+            return
+        self._resumed = True
+        pending = self.outbox.pending()[0]
+        if pending and (self._thread is None or not self._thread.is_alive()):
+            logger.info("Replaying %d rows left in the Sheets outbox", pending)
+            self._ensure_worker(sheets_service)
+
+    def _flush(self):
+        """
+        Reclama y sube un lote. Devuelve None si no quedaba nada que reclamar y False si
+        la API falló (las filas siguen pendientes).
+        """
+        spreadsheet_id, ids, values = self.outbox.claim_batch(self.flush_max_rows)
+        if not ids:
+            return None
+        started = time.monotonic()
+        try:
+            append_rows(self._sheets_service, spreadsheet_id, values)
+        except Exception as e:
+            self._count('failed_uploads')
+            self.last_error = str(e)
+            self.outbox.mark_failed(ids, str(e))
+            logger.exception("Could not append %d rows to spreadsheet %s; kept in outbox", len(ids), spreadsheet_id)
+            return False
+        finally:
+            self.last_upload_seconds = time.monotonic() - started
+        if self.last_upload_seconds > self.outbox.lease_seconds:
+            logger.warning("Append of %d rows took %.0fs, longer than the outbox lease", len(ids),
+                           self.last_upload_seconds)
+        self.outbox.mark_sent(ids)
+        self._count('uploaded_rows', len(ids))
+        self._count('flushes')
+        return True
+
+    def _drain(self):
+        """Sube lotes mientras se puedan reclamar; se detiene en el primer fallo."""
+        while True:
+            result = self._flush()
+            if result is None:
+                return True
+            if not result:
+                return False
+
+    def _next_wait(self):
+        if self._retry_at is not None:
+            return max(0.0, self._retry_at - time.monotonic())
+        count, oldest = self.outbox.pending()
+        if not count:
+            # Lotes reclamados por otro proceso: se vuelve a mirar cuando expire su lease
+            expiry = self.outbox.next_lease_expiry()
+            return None if expiry is None else max(0.0, expiry - time.time()) + 0.1
+        if count >= self.flush_max_rows:
+            return 0.0
+        return max(0.0, oldest + self.flush_interval - time.time())
+
+    def _schedule_retry(self):
+        self._failures += 1
+        backoff = min(self.retry_max_seconds, self.flush_interval * 2 ** self._failures)
+        self._retry_at = time.monotonic() + backoff
+
+    def _step(self):
+        """Una vuelta del hilo; devuelve True cuando debe terminar."""
+        self._wake.wait(self._next_wait())
+        self._wake.clear()
+        if self._closed:
+            self._drain()
+            return True
+        if self._retry_at is not None:
+            if time.monotonic() < self._retry_at:
+                return False
+        else:
+            count, oldest = self.outbox.pending()
+            if not count or (count < self.flush_max_rows and time.time() - oldest < self.flush_interval):
+                return False
+        if self._drain():
+            self._failures = 0
+            self._retry_at = None
+        else:
+            self._schedule_retry()
+        return False
+
+    def _run(self):
+        try:
+            self.outbox.prune()
+        except Exception:
+            logger.exception("Could not prune the Sheets outbox")
+        while True:
+            try:
+                if self._step():
+                    return
+            except Exception as e:
+                # Errores del outbox (p. ej. "database is locked") no deben matar el hilo
+                self.last_error = str(e)
+                logger.exception("Sheets writer iteration failed, retrying with backoff")
+                self._schedule_retry()
+                if self._closed:
+                    return
+
+    def close(self, timeout=SHEETS_SHUTDOWN_TIMEOUT):
+        """Intenta subir lo pendiente y para el hilo; lo que no se suba queda en el outbox."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._wake.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error("Sheets writer did not finish within %.0fs at shutdown", timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats.update(self.outbox.stats())
+        stats['consecutive_failures'] = self._failures
+        stats['last_upload_seconds'] = self.last_upload_seconds
+        stats['last_error'] = self.last_error
+        return stats
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_sheets_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SheetsWriter()
+            # Garantiza el último flush cuando el servidor se detiene
+            atexit.register(_writer.close)
+        return _writer
+
+
+def submit_rows(sheets_service, spreadsheet_id, values):
+    """Guarda las filas en el outbox local y vuelve sin esperar a la API."""
+    get_sheets_writer().submit(sheets_service, spreadsheet_id, values)
+
+
+def resume_uploads(sheets_service):
+    get_sheets_writer().resume(sheets_service)
+
+
+def writer_stats():
+    return get_sheets_writer().stats()
@@ -0,0 +1,228 @@
+"""Servidor opcional de assets con URLs por hash y caché de data URIs para cuando no está activo."""
+
+import os
+import base64
+import asyncio
+import logging
+import mimetypes
+import threading
+from pathlib import Path
+
+import tornado.web
+import tornado.netutil
+import tornado.httpserver
+
+from local_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# URL pública del servidor de assets (detrás de un proxy) y puerto; sin ninguno de
+# los dos el servidor no arranca, porque un segundo puerto no es accesible detrás de
+# TLS o de un proxy de un solo puerto. Solo escucha en localhost salvo que se indique
+STATIC_ASSETS_URL = os.getenv('STATIC_ASSETS_URL')
+STATIC_ASSETS_PORT = int(os.getenv('STATIC_ASSETS_PORT', '8502' if STATIC_ASSETS_URL else '0'))
+STATIC_ASSETS_ADDRESS = os.getenv('STATIC_ASSETS_ADDRESS', '127.0.0.1')
+
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+ASSET_PREFIX = "/assets/"
+
+mimetypes.add_type('video/mp4', '.mp4')
+mimetypes.add_type('image/webp', '.webp')
+
+
+def mimetype_for(path):
+    return mimetypes.guess_type(str(path))[0] or 'application/octet-stream'
+
+
+class AssetRegistry:
+    """Nombres con hash -> rutas locales; solo se sirven archivos registrados."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name = {}
+        self._by_path = {}
+
+    def register(self, path):
+        """Nombre con hash del contenido actual de `path` (se recalcula si cambia el mtime)."""
+        path = Path(path).resolve()
+        stat = path.stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._by_path.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        name = f"{path.stem}.{file_digest(path, 'sha256')[:16]}{path.suffix}"
+        with self._lock:
+            self._by_path[path] = (version, name)
+            self._by_name[name] = path
+        return name
+
+    def resolve(self, name):
+        with self._lock:
+            return self._by_name.get(name)
+
+
+class HashedAssetHandler(tornado.web.StaticFileHandler):
+    """StaticFileHandler con rangos y ETag de tornado; las URLs nunca cambian de contenido."""
+
+    def initialize(self, registry):
+        super().initialize(path='/')
+        self.registry = registry
+
+    @classmethod
+    def get_absolute_path(cls, root, path):
+        return path
+
+    def validate_absolute_path(self, root, absolute_path):
+        path = self.registry.resolve(absolute_path)
+        if path is None or not path.is_file():
+            raise tornado.web.HTTPError(404)
+        return str(path)
+
+    def get_cache_time(self, path, modified, mime_type):
+        return ASSET_MAX_AGE
+
+    def set_extra_headers(self, path):
+        self.set_header('Cache-Control', f"public, max-age={ASSET_MAX_AGE}, immutable")
+        self.set_header('Access-Control-Allow-Origin', '*')
+
+
+class AssetServer:
+    """Servidor tornado en un hilo daemon, uno por proceso."""
+
+    def __init__(self, port=STATIC_ASSETS_PORT, address=STATIC_ASSETS_ADDRESS, public_url=STATIC_ASSETS_URL):
+        self.port = port
+        self.address = address
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.registry = AssetRegistry()
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        # Se enlaza el socket aquí para que un puerto ocupado se detecte en el acto
+        sockets = tornado.netutil.bind_sockets(self.port, self.address)
+        self.port = sockets[0].getsockname()[1]
+        app = tornado.web.Application([
+            (rf"{ASSET_PREFIX}(.+)", HashedAssetHandler, {'registry': self.registry}),
+        ])
+        self._thread = threading.Thread(target=self._serve, args=(app, sockets), name="static-assets", daemon=True)
+        self._thread.start()
+        self.running = True
+        logger.info("Serving static assets on port %s", self.port)
+
+    def _serve(self, app, sockets):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = tornado.httpserver.HTTPServer(app)
+        server.add_sockets(sockets)
+        loop.run_forever()
+
+    def url_for(self, path, request_host=None):
+        """URL absoluta del asset; sin STATIC_ASSETS_URL se usa el host de la petición."""
+        name = self.registry.register(path)
+        if self.public_url:
+            base = self.public_url
+        elif self.address in ('127.0.0.1', 'localhost', '::1'):
+            # Solo accesible desde la propia máquina (quiosco con navegador local)
+            base = f"http://localhost:{self.port}"
+        else:
+            hostname = (request_host or 'localhost').rsplit(':', 1)[0]
+            base = f"http://{hostname}:{self.port}"
+        return f"{base}{ASSET_PREFIX}{name}"
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_asset_server():
+    """Arranca el servidor la primera vez; None si está desactivado o no pudo arrancar."""
+    global _server
+    with _server_lock:
+        if _server is None and STATIC_ASSETS_PORT:
+            server = AssetServer()
+            try:
+                server.start()
+            except OSError as e:
+                logger.warning("Static asset server disabled, falling back to inline data: %s", e)
+            _server = server
+        return _server if _server is not None and _server.running else None
+
+
+class InlineAssetCache:
+    """Bytes y data URIs por ruta, leídos una vez por proceso mientras no cambie el archivo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, path, kind, load):
+        path = Path(path).resolve()
+        stat = path.stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._entries.get((path, kind))
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        value = load(path)
+        with self._lock:
+            # Reemplaza la versión anterior del mismo archivo
+            self._entries[(path, kind)] = (version, value)
+        return value
+
+    def read(self, path):
+        """Contenido del archivo, p. ej. para pasarlo a st.video sin leer el disco en cada rerun."""
+        return self._load(path, 'bytes', Path.read_bytes)
+
+    def get(self, path):
+        """Data URI del archivo."""
+        def encode(path):
+            encoded = base64.b64encode(path.read_bytes()).decode('utf-8')
+            return f"data:{mimetype_for(path)};base64,{encoded}"
+        return self._load(path, 'uri', encode)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'items': len(self._entries),
+                'bytes': sum(len(value) for _, value in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_inline_cache = InlineAssetCache()
+
+
+def data_uri(path):
+    return _inline_cache.get(path)
+
+
+def asset_bytes(path):
+    return _inline_cache.read(path)
+
+
+def asset_stats():
+    """Uso de memoria de los assets inline y estado del servidor."""
+    server = get_asset_server()
+    return {
+        'server_port': server.port if server is not None else None,
+        'inline': _inline_cache.stats(),
+    }
+
+
+def asset_url(path, request_host=None):
+    """URL cacheable del asset, o None si el servidor de assets no está activo."""
+    server = get_asset_server()
+    if server is not None:
+        return server.url_for(path, request_host)
+    return None
+
+
+def asset_src(path, request_host=None):
+    """Valor para un atributo `src`: URL cacheable del asset o, sin servidor, un data URI."""
+    return asset_url(path, request_host) or data_uri(path)
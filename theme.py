@@ -0,0 +1,110 @@
+"""Hoja de estilos única de la app, instalada en el <head> una vez por cambio de página."""
+
+import re
+import json
+import hashlib
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+STYLE_ELEMENT_ID = "falling-walls-styles"
+
+BUTTON_CSS = """
+div.stButton > button:focus,
+div.stButton > button:active {
+    background-color: #1a5d9c;
+    color: white !important;
+    border: none !important;
+    outline: none; /* Evita el contorno azul por defecto */
+    box-shadow: none !important;
+}
+div.stButton > button {
+    display: block;
+    margin: 0 auto;
+    font-size: 20px;
+    padding: 10px 40px;
+    background-color: #2986cc;
+    color: white;
+    border: none;
+    border-radius: 8px;
+    cursor: pointer;
+}
+div.stButton > button:hover {
+    background-color: #1a5d9c;
+    color: #F0FFFF !important; /* color al pasar el cursor */
+    border: none;
+}
+"""
+
+# Eliminar padding superior en el elemento raíz
+NO_TOP_PADDING_CSS = """
+#root > div:nth-child(1) > div > div > div > div > section > div {
+    padding-top: 0rem;
+}
+"""
+
+QUESTIONNAIRE_CSS = """
+/* Centrar las imágenes y sus captions */
+[data-testid="column"] > div:first-child {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+}
+[data-testid="column"] > div:first-child > div {
+    width: 100%;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+}
+[data-testid="caption"] {
+    text-align: center !important;
+}
+/* Etiquetas seleccionadas */
+.stButton > button[kind=secondary] {
+    background-color: #28a745cc;
+    color: white;
+    border: 1px solid white;
+}
+"""
+
+PAGE_CSS = {
+    'landing': NO_TOP_PADDING_CSS,
+    'questionnaire': NO_TOP_PADDING_CSS + QUESTIONNAIRE_CSS,
+}
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def stylesheet_for(page):
+    return minify_css(BUTTON_CSS + PAGE_CSS.get(page, ''))
+
+
+def apply_page_styles(page):
+    """Instala la hoja de estilos de `page` si la sesión aún no la tiene."""
+    # El hueco se emite en cada rerun para que los elementos de después no cambien de
+    # posición (y no se vuelvan a montar sus iframes); solo se rellena al cambiar el CSS
+    slot = st.empty()
+    css = stylesheet_for(page)
+    digest = hashlib.sha1(css.encode('utf-8')).hexdigest()
+    if st.session_state.get('styles_digest') == digest:
+        return
+    st.session_state.styles_digest = digest
+    # El iframe del componente comparte origen con la app y escribe en su <head>
+    with slot:
+        components.html(f"""
+        <script>
+        const doc = window.parent.document;
+        let style = doc.getElementById({json.dumps(STYLE_ELEMENT_ID)});
+        if (!style) {{
+            style = doc.createElement("style");
+            style.id = {json.dumps(STYLE_ELEMENT_ID)};
+            doc.head.appendChild(style);
+        }}
+        style.textContent = {json.dumps(css)};
+        </script>
+        """, height=0)